@@ -0,0 +1,241 @@
+import os
+
+import numpy as np
+
+from file_lock import temp_path
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+class IVFIndex:
+    """Inverted-file index: k-means coarse quantizer plus per-cluster id lists.
+
+    A query is compared against the centroids, then exactly against the rows
+    of the nprobe closest clusters. Raising nprobe trades latency for recall.
+    """
+
+    kind = 'ivf'
+    suffix = '.ivf.npz'
+    # Re-train centroids once the gallery doubles past the training size
+    retrain_factor = 2
+
+    def __init__(self, nlist=None, nprobe=8, iterations=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        """Drop all trained state"""
+        self.centroids = None
+        self._lists = []
+        self._arrays = {}
+        self._size = 0
+        self.trained_size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def _assign(self, rows, chunk=8192):
+        centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        labels = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), chunk):
+            block = rows[start:start + chunk]
+            # |c|^2 - 2 x.c is enough to rank centroids for a given row
+            scores = centroid_norms[None, :] - 2.0 * (block @ self.centroids.T)
+            labels[start:start + chunk] = np.argmin(scores, axis=1)
+        return labels
+
+    def build(self, matrix):
+        """Train centroids on the gallery and assign every row"""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        size = len(matrix)
+        nlist = self.nlist or max(1, int(2 * np.sqrt(size)))
+        nlist = min(nlist, size)
+        rng = np.random.default_rng(self.seed)
+
+        # k-means on a sample of ~32 rows per centroid
+        sample = matrix
+        if size > 32 * nlist:
+            sample = matrix[rng.choice(size, 32 * nlist, replace=False)]
+        self.centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = self._assign(sample)
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=nlist)
+            filled = counts > 0
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            self.centroids[filled] = sums / counts[filled, None]
+
+        self._lists = [[] for _ in range(nlist)]
+        self._arrays = {}
+        self._size = 0
+        self.add(matrix, 0)
+        self.trained_size = size
+
+    def add(self, rows, start):
+        """Insert gallery rows [start, start + len(rows)) into their clusters"""
+        rows = np.asarray(rows, dtype=np.float32)
+        if not len(rows):
+            return
+        for offset, label in enumerate(self._assign(rows)):
+            self._lists[label].append(start + offset)
+            self._arrays.pop(label, None)
+        self._size = max(self._size, start + len(rows))
+
+    def _members(self, label):
+        members = self._arrays.get(label)
+        if members is None:
+            members = np.asarray(self._lists[label], dtype=np.int64)
+            self._arrays[label] = members
+        return members
+
+    def retire(self, indices):
+        """Nothing to do: retired rows have infinite norms, so they never win"""
+
+    def search(self, queries, matrix, norms):
+        """Return (indices, distances) of the nearest gallery row per query"""
+        count = len(queries)
+        indices = np.full(count, -1, dtype=np.int64)
+        distances = np.full(count, np.inf, dtype=np.float32)
+        nprobe = min(self.nprobe, len(self.centroids))
+        centroid_scores = (np.einsum('ij,ij->i', self.centroids, self.centroids)[None, :]
+                           - 2.0 * (queries @ self.centroids.T))
+        probes = np.argpartition(centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+
+        for q, labels in enumerate(probes):
+            candidates = np.concatenate([self._members(label) for label in labels])
+            if not len(candidates):
+                continue
+            squared = norms[candidates] + query_norms[q] - 2.0 * (matrix[candidates] @ queries[q])
+            best = int(np.argmin(squared))
+            indices[q] = candidates[best]
+            distances[q] = np.sqrt(max(float(squared[best]), 0.0))
+        return indices, distances
+
+    def save(self, path):
+        labels = np.full(self._size, -1, dtype=np.int64)
+        for label, members in enumerate(self._lists):
+            labels[members] = label
+        # Written aside and swapped in, so other workers never load half a file
+        temp_file = temp_path(path)
+        with open(temp_file, 'wb') as f:
+            np.savez(f, centroids=self.centroids, labels=labels,
+                     nprobe=self.nprobe, trained_size=self.trained_size)
+        os.replace(temp_file, path)
+
+    def load(self, path):
+        data = np.load(path)
+        self.centroids = data['centroids']
+        self.trained_size = int(data['trained_size'])
+        labels = data['labels']
+        self._lists = [[] for _ in range(len(self.centroids))]
+        self._arrays = {}
+        for row, label in enumerate(labels):
+            if label >= 0:
+                self._lists[label].append(row)
+        self._size = len(labels)
+
+
+class HNSWIndex:
+    """Graph index backed by the optional hnswlib package.
+
+    ef controls the search beam width: higher is slower but more accurate.
+    """
+
+    kind = 'hnsw'
+    suffix = '.hnsw.bin'
+    retrain_factor = None
+
+    def __init__(self, ef=64, m=16, ef_construction=200):
+        if hnswlib is None:
+            raise ImportError("hnswlib is required for the HNSW index (pip install hnswlib)")
+        self.ef = ef
+        self.m = m
+        self.ef_construction = ef_construction
+        self.reset()
+
+    def reset(self):
+        """Drop all trained state"""
+        self._index = None
+        self.trained_size = 0
+
+    def __len__(self):
+        return self._index.get_current_count() if self._index is not None else 0
+
+    @property
+    def is_trained(self):
+        return self._index is not None
+
+    def _create(self, capacity):
+        self._index = hnswlib.Index(space='l2', dim=128)
+        self._index.init_index(max_elements=capacity, ef_construction=self.ef_construction, M=self.m)
+        self._index.set_ef(self.ef)
+
+    def build(self, matrix):
+        self._create(max(2 * len(matrix), 1024))
+        self.add(matrix, 0)
+        self.trained_size = len(matrix)
+
+    def add(self, rows, start):
+        rows = np.asarray(rows, dtype=np.float32)
+        if not len(rows):
+            return
+        needed = start + len(rows)
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+        self._index.add_items(rows, np.arange(start, needed))
+
+    def retire(self, indices):
+        for label in indices:
+            try:
+                self._index.mark_deleted(int(label))
+            except RuntimeError:
+                # Already deleted, or not added yet
+                pass
+
+    def search(self, queries, matrix, norms):
+        labels, squared = self._index.knn_query(queries, k=1)
+        return labels[:, 0].astype(np.int64), np.sqrt(np.maximum(squared[:, 0], 0.0))
+
+    def save(self, path):
+        temp_file = temp_path(path)
+        self._index.save_index(temp_file)
+        os.replace(temp_file, path)
+
+    def load(self, path):
+        self._index = hnswlib.Index(space='l2', dim=128)
+        self._index.load_index(path)
+        self._index.set_ef(self.ef)
+        self.trained_size = self._index.get_current_count()
+
+
+def create_index(kind='auto', probes=None):
+    """Create an ANN index; probes is nprobe (IVF) or ef (HNSW).
+
+    Returns None for 'exact', which keeps brute-force matching.
+    """
+    if kind == 'auto':
+        kind = 'hnsw' if hnswlib is not None else 'ivf'
+    if kind == 'exact':
+        return None
+    if kind == 'ivf':
+        return IVFIndex(nprobe=probes or 8)
+    if kind == 'hnsw':
+        return HNSWIndex(ef=probes or 64)
+    raise ValueError(f"Unknown index type: {kind}")
+
+
+def index_path(encodings_file, index):
+    """Path of the persisted index next to the encodings file"""
+    return os.path.splitext(encodings_file)[0] + index.suffix
@@ -0,0 +1,88 @@
+import csv
+import io
+import os
+import threading
+
+
+class AttendanceIndex:
+    """In-memory (date, name) index over the attendance CSV.
+
+    The file is read once at startup; afterwards only bytes appended since the
+    last read are parsed, so rows written by other processes are picked up
+    without re-reading the whole history.
+    """
+
+    def __init__(self, attendance_file):
+        self.attendance_file = attendance_file
+        self._marked = set()
+        self._offset = 0
+        self._header = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Rebuild the index from the full attendance file"""
+        with self._lock:
+            self._marked.clear()
+            self._offset = 0
+            self._header = None
+            self._read_new_rows()
+
+    def refresh(self):
+        """Pick up rows appended to the file since the last read"""
+        with self._lock:
+            self._read_new_rows()
+
+    def _read_new_rows(self):
+        try:
+            size = os.path.getsize(self.attendance_file)
+        except OSError:
+            return
+        if size < self._offset:
+            # File was truncated or replaced, start over
+            self._marked.clear()
+            self._offset = 0
+            self._header = None
+        if size == self._offset:
+            return
+
+        with open(self.attendance_file, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read(size - self._offset)
+
+        # Only consume complete lines; a partial row is picked up next time
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            return
+        chunk = chunk[:end + 1]
+        self._offset += len(chunk)
+
+        reader = csv.reader(io.StringIO(chunk.decode('utf-8', errors='replace')))
+        for row in reader:
+            if not row:
+                continue
+            if self._header is None:
+                self._header = {column: i for i, column in enumerate(row)}
+                continue
+            try:
+                name = row[self._header['Name']]
+                date = row[self._header['Date']]
+            except (KeyError, IndexError):
+                continue
+            self._marked.add((date, name))
+
+    def add(self, name, date):
+        """Record a row written by this process"""
+        with self._lock:
+            self._marked.add((date, name))
+
+    def contains(self, name, date):
+        """Check whether attendance exists for name on date"""
+        with self._lock:
+            if (date, name) in self._marked:
+                return True
+            self._read_new_rows()
+            return (date, name) in self._marked
+
+    def __len__(self):
+        return len(self._marked)
@@ -0,0 +1,105 @@
+import threading
+
+
+class AttendanceSummary:
+    """Per-day and per-student attendance rollups kept up to date in memory.
+
+    The history is read from storage once, on first use. Rows this
+    process commits are folded in straight away (pass add() as its
+    writer's on_commit); rows written by other workers are read from the
+    storage cursor onwards when storage.attendance_changed() says there
+    are any. Finished summaries are cached until the next new row.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.version = 0
+        self._days = {}
+        self._students = {}
+        self._built = False
+        self._cursor = None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _catch_up(self):
+        """Fold in rows stored since the last read; True if anything changed"""
+        changed = False
+        for cursor, record in self.storage.iter_attendance(after=self._cursor):
+            # Rows already folded in by add() change nothing the second time
+            changed |= self._add_row(record.get('Name'), record.get('Student_ID'),
+                                     record.get('Date'), record.get('Time'))
+            self._cursor = cursor
+        self._built = True
+        return changed
+
+    def _add_row(self, name, student_id, date, time):
+        if not name or not date:
+            return False
+        day = self._days.setdefault(date, {})
+        if name in day:
+            if time and time < day[name]:
+                day[name] = time
+                return True
+            return False
+        day[name] = time or ''
+
+        student = self._students.setdefault(name, {'student_id': student_id, 'days_present': 0,
+                                                   'first_date': date, 'last_date': date})
+        student['days_present'] += 1
+        student['first_date'] = min(student['first_date'], date)
+        student['last_date'] = max(student['last_date'], date)
+        return True
+
+    def add(self, rows):
+        """Fold committed [name, student_id, date, time, status] rows in"""
+        with self._lock:
+            if not self._built:
+                # Not read yet; the rows are picked up from storage on first use
+                return
+            if any([self._add_row(*row[:4]) for row in rows]):
+                self.version += 1
+                self._cache.clear()
+
+    def summary(self, total_students):
+        """Per-day and per-student aggregates, with percentages of total_students"""
+        with self._lock:
+            if not self._built:
+                self._catch_up()
+            elif self.storage.attendance_changed(self._cursor) and self._catch_up():
+                self.version += 1
+                self._cache.clear()
+            if total_students not in self._cache:
+                self._cache[total_students] = self._summarize(total_students)
+            return self._cache[total_students]
+
+    def _summarize(self, total_students):
+        session_days = len(self._days)
+        days = []
+        for date in sorted(self._days, reverse=True):
+            day = self._days[date]
+            present = len(day)
+            days.append({
+                'date': date,
+                'present': present,
+                'first_seen': min(day.values()) if day else None,
+                'percentage': round(100.0 * present / total_students, 1) if total_students else 0.0,
+            })
+        students = []
+        for name in sorted(self._students):
+            student = self._students[name]
+            students.append(dict(student, name=name, percentage=round(
+                100.0 * student['days_present'] / session_days, 1) if session_days else 0.0))
+        return {
+            'version': self.version,
+            'total_students': total_students,
+            'session_days': session_days,
+            'days': days,
+            'students': students,
+        }
+
+    def day(self, date, total_students):
+        """Aggregates for one date (zero counts when nobody was marked)"""
+        for day in self.summary(total_students)['days']:
+            if day['date'] == date:
+                return day
+        return {'date': date, 'present': 0, 'first_seen': None, 'percentage': 0.0}
@@ -1,110 +1,173 @@
-import cv2
-import numpy as np
-import face_recognition
+import importlib.util
 import os
-import csv
-import pandas as pd
 from datetime import datetime
-import json
-import pickle
+import argparse
 from pathlib import Path
 
+# OpenCV, dlib/face_recognition and pandas are imported by the commands that
+# use them, so reports and --help start without loading the models
+from ann_index import create_index, index_path
+from attendance_summary import AttendanceSummary
+from attendance_writer import AttendanceWriter
+from face_gallery import FaceGallery
+from face_templates import build_templates, retired_rows
+from recognition_cache import RecognitionCache
+from storage import ATTENDANCE_COLUMNS, create_storage
+
 class FaceRecognitionAttendanceSystem:
     def __init__(self):
-        self.known_face_encodings = []
-        self.known_face_names = []
+        self.gallery = FaceGallery(tolerance=0.6)
         self.attendance_records = []
         self.attendance_file = "attendance_records.csv"
+        # Legacy pickle, migrated once into the memory-mapped store
         self.encodings_file = "face_encodings.pkl"
         self.students_db = "students_database.json"
+        # Storage backend: 'files' (JSON/CSV/encoding store) or 'sqlite' (see storage.py)
+        self.storage_backend = "files"
+        self.database_file = "attendance.db"
+        # ANN index for large galleries: 'auto', 'ivf', 'hnsw' or 'exact'
+        self.match_index = "auto"
+        self.match_probes = None
+        # Face tracking: detect every N frames, re-encode tracks every M frames,
+        # optionally move boxes in between with an OpenCV tracker ('KCF', 'CSRT')
+        self.detect_interval = 2
+        self.track_refresh_interval = 30
+        self.cv_tracker = None
+        # Face detector: 'hog', 'cnn', 'dnn', 'yunet' or 'haar' (see face_detector.py)
+        self.detector_backend = "hog"
+        self.detection_scale = 0.25
+        self.adaptive_scale = False
+        # Recent match results reused for near-identical faces (see recognition_cache.py)
+        self.recognition_cache_size = 256
+        self.recognition_cache_ttl = 10.0
+        # Faces too small, blurred, badly lit or turned away are not encoded:
+        # QualityGate thresholds overriding its defaults (see face_quality.py),
+        # e.g. {'min_face_size': 32}; None disables the gate
+        self.face_quality = {}
+        # Attendance rows are group-committed by a writer thread; fsync policy
+        # is 'batch', 'interval' or 'never' (see attendance_writer.py)
+        self.attendance_flush_interval = 0.5
+        self.attendance_fsync = "batch"
         
         # Create necessary directories
         Path("student_images").mkdir(exist_ok=True)
         Path("attendance_data").mkdir(exist_ok=True)
         
         # Load existing data
+        self.storage = create_storage(self.storage_backend, database_file=self.database_file,
+                                      students_db=self.students_db, attendance_file=self.attendance_file,
+                                      encodings_base="face_encodings", encodings_pickle=self.encodings_file)
         self.load_student_database()
         self.load_face_encodings()
-        self.setup_attendance_file()
+        # Rollups for reports, kept current as the writer commits rows
+        self.attendance_summary = AttendanceSummary(self.storage)
+        self.attendance_writer = AttendanceWriter(self.storage, self.attendance_flush_interval,
+                                                  fsync=self.attendance_fsync,
+                                                  on_commit=self.attendance_summary.add)
     
     def load_student_database(self):
-        """Load student database from JSON file"""
-        try:
-            with open(self.students_db, 'r') as f:
-                self.students_data = json.load(f)
-        except FileNotFoundError:
-            self.students_data = {}
+        """Load student database from storage"""
+        self.students_data = self.storage.load_students()
+        if not self.students_data:
             print("No existing student database found. Starting fresh.")
     
-    def save_student_database(self):
-        """Save student database to JSON file"""
-        with open(self.students_db, 'w') as f:
-            json.dump(self.students_data, f, indent=2)
+    def save_student_database(self, names=None):
+        """Save students (all, or just the given names) to storage"""
+        self.storage.save_students(self.students_data, names)
     
-    def add_student(self, name, student_id, image_path):
-        """Add a new student to the database"""
+    def add_student(self, name, student_id, image_paths):
+        """Add a student from one or more photos, or add photos to an enrolled student_id"""
+        if isinstance(image_paths, str):
+            # A single photo, as add_student() took before multi-photo enrollment
+            image_paths = [image_paths]
         try:
-            # Load and encode the face
-            image = face_recognition.load_image_file(image_path)
-            face_encodings = face_recognition.face_encodings(image)
-            
-            if len(face_encodings) == 0:
-                print(f"No face detected in {image_path}")
-                return False
+            from bulk_enroll import encode_image
             
-            # Store student data
-            self.students_data[name] = {
-                'student_id': student_id,
-                'image_path': image_path,
-                'added_date': datetime.now().isoformat()
-            }
+            # Encode the face in each photo
+            encodings = []
+            qualities = []
+            for image_path in image_paths:
+                sample, error = encode_image(image_path)
+                if error:
+                    print(f"Skipping {image_path}: {error}")
+                    continue
+                encodings.append(sample[0])
+                qualities.append(sample[1])
             
-            # Store face encoding
-            self.known_face_encodings.append(face_encodings[0])
-            self.known_face_names.append(name)
+            if not encodings:
+                print("No usable face found in the photos")
+                return False
             
-            # Save to files
-            self.save_student_database()
-            self.save_face_encodings()
+            # Build or update the student's template and save it
+            self.commit_students([(name, student_id, image_paths[0], encodings, qualities)])
             
-            print(f"Student {name} (ID: {student_id}) added successfully!")
+            print(f"Student {name} (ID: {student_id}) added successfully from {len(encodings)} photo(s)!")
             return True
             
         except Exception as e:
             print(f"Error adding student: {str(e)}")
             return False
     
-    def load_face_encodings(self):
-        """Load face encodings from pickle file"""
+    def bulk_enroll(self, source, workers=None, per_student_folders=False):
+        """Enroll every student photo in a directory or zip archive"""
+        from bulk_enroll import collect_source, encode_images, group_by_student
+        extract_dir = os.path.join("student_images", Path(source).stem)
         try:
-            with open(self.encodings_file, 'rb') as f:
-                data = pickle.load(f)
-                self.known_face_encodings = data['encodings']
-                self.known_face_names = data['names']
-            print(f"Loaded {len(self.known_face_encodings)} face encodings")
-        except FileNotFoundError:
-            print("No existing face encodings found.")
+            entries = collect_source(source, extract_dir, per_student_folders)
+        except Exception as e:
+            print(f"Error reading {source}: {str(e)}")
+            return 0, []
+        
+        print(f"Encoding {len(entries)} images...")
+        enrolled, failures = encode_images(entries, workers)
+        students = group_by_student(enrolled)
+        self.commit_students(students)
+        
+        for failure in failures:
+            print(f"✗ {failure['image']}: {failure['error']}")
+        print(f"Enrolled {len(students)} students from {len(enrolled)} images, {len(failures)} images failed")
+        return len(students), failures
+    
+    def commit_students(self, students):
+        """Create or update the templates of (name, student_id, image_path, encodings, qualities) students"""
+        if not students:
+            return
+        encodings, labels, student_ids, kinds, qualities = build_templates(
+            self.storage, self.students_data, students, datetime.now().isoformat())
+        
+        # The new templates replace each student's earlier rows in the gallery
+        first_row = len(self.gallery)
+        self.gallery.add_many(encodings, labels)
+        self.gallery.retire(retired_rows(self.gallery.names,
+                                         [{'name': label, 'kind': kind} for label, kind in zip(labels, kinds)],
+                                         first_row))
+        self.save_student_database(list(dict.fromkeys(labels)))
+        self.save_face_encodings(encodings, labels, student_ids, kinds, qualities)
     
-    def save_face_encodings(self):
-        """Save face encodings to pickle file"""
-        data = {
-            'encodings': self.known_face_encodings,
-            'names': self.known_face_names
-        }
-        with open(self.encodings_file, 'wb') as f:
-            pickle.dump(data, f)
+    def load_face_encodings(self):
+        """Load face encodings from storage into the gallery"""
+        encodings, entries = self.storage.load_encodings(self.students_data)
+        self.gallery = FaceGallery.from_matrix(encodings, [entry['name'] for entry in entries],
+                                               tolerance=self.gallery.tolerance)
+        if len(self.gallery):
+            print(f"Loaded {len(self.gallery)} face encodings")
+        else:
+            print("No existing face encodings found.")
+        
+        index = create_index(self.match_index, self.match_probes)
+        if index is not None:
+            self.gallery.attach_index(index, index_path(self.encodings_file, index))
+        self.gallery.retire(retired_rows(self.gallery.names, entries, 0))
     
-    def setup_attendance_file(self):
-        """Setup attendance CSV file with headers"""
-        if not os.path.exists(self.attendance_file):
-            with open(self.attendance_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Name', 'Student_ID', 'Date', 'Time', 'Status'])
+    def save_face_encodings(self, encodings, names, student_ids=None, kinds=None, qualities=None):
+        """Append new face encodings to storage"""
+        self.storage.append_encodings(encodings, names, student_ids, kinds, qualities)
+        self.gallery.save_index()
     
-    def mark_attendance(self, name):
-        """Mark attendance for a student"""
+    def mark_attendance(self, name, when=None):
+        """Mark attendance for a student, at `when` (default: now)"""
         if name in self.students_data:
-            now = datetime.now()
+            now = when or datetime.now()
             date_str = now.strftime("%Y-%m-%d")
             time_str = now.strftime("%H:%M:%S")
             
@@ -113,16 +176,15 @@ class FaceRecognitionAttendanceSystem:
                 print(f"Attendance already marked for {name} today")
                 return False
             
-            # Mark attendance
-            with open(self.attendance_file, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    name,
-                    self.students_data[name]['student_id'],
-                    date_str,
-                    time_str,
-                    'Present'
-                ])
+            # Mark attendance; the row is written by the background writer
+            self.storage.add_marked(name, date_str)
+            self.attendance_writer.submit([
+                name,
+                self.students_data[name]['student_id'],
+                date_str,
+                time_str,
+                'Present'
+            ])
             
             print(f"Attendance marked for {name} at {time_str}")
             return True
@@ -130,15 +192,33 @@ class FaceRecognitionAttendanceSystem:
     
     def is_already_marked_today(self, name, date):
         """Check if attendance is already marked for today"""
-        try:
-            df = pd.read_csv(self.attendance_file)
-            today_records = df[(df['Name'] == name) & (df['Date'] == date)]
-            return len(today_records) > 0
-        except:
-            return False
+        return self.storage.is_marked(name, date)
+    
+    def create_recognizer(self, camera_id='default'):
+        """Frame recognizer that marks attendance for matched faces"""
+        from face_detector import create_detector
+        from face_quality import QualityGate
+        from recognition import FrameRecognizer
+        
+        def on_match(name):
+            if self.mark_attendance(name):
+                print(f"✓ Attendance marked for {name}")
+        
+        detector = create_detector(self.detector_backend, scale=self.detection_scale,
+                                   adaptive=self.adaptive_scale)
+        return FrameRecognizer(self.gallery, on_match, detector,
+                               detect_interval=self.detect_interval,
+                               refresh_interval=self.track_refresh_interval,
+                               cv_tracker=self.cv_tracker,
+                               cache=RecognitionCache(self.recognition_cache_size, self.recognition_cache_ttl),
+                               camera_id=camera_id,
+                               quality_gate=QualityGate(camera_id=camera_id, **self.face_quality)
+                               if self.face_quality is not None else None)
     
     def start_attendance_session(self):
         """Start live attendance session using webcam"""
+        import cv2
+        from frame_pipeline import annotate_frame
         video_capture = cv2.VideoCapture(0)
         
         # Set camera properties for better performance
@@ -148,9 +228,8 @@ class FaceRecognitionAttendanceSystem:
         
         print("Starting attendance session... Press 'q' to quit")
         
-        # Process every nth frame for better performance
-        frame_count = 0
-        process_this_frame = True
+        # Detect every detect_interval frames and track faces in between
+        recognizer = self.create_recognizer()
         
         while True:
             ret, frame = video_capture.read()
@@ -158,75 +237,12 @@ class FaceRecognitionAttendanceSystem:
                 print("Failed to grab frame from camera")
                 break
             
-            # Only process every other frame to save time
-            if process_this_frame:
-                # Resize frame for faster processing
-                small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-                
-                # Convert BGR to RGB (face_recognition uses RGB)
-                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-                
-                # Find faces in current frame
-                try:
-                    face_locations = face_recognition.face_locations(rgb_small_frame)
-                    
-                    # Only proceed if faces are found
-                    if face_locations:
-                        # Get face encodings - using a more robust approach
-                        face_encodings = []
-                        for face_location in face_locations:
-                            try:
-                                # Get face encoding for each face location
-                                encoding = face_recognition.face_encodings(rgb_small_frame, [face_location], num_jitters=1)
-                                if encoding:
-                                    face_encodings.append(encoding[0])
-                                else:
-                                    face_encodings.append(None)
-                            except Exception as e:
-                                print(f"Error encoding face: {e}")
-                                face_encodings.append(None)
-                        
-                        # Process each face
-                        for i, (face_encoding, face_location) in enumerate(zip(face_encodings, face_locations)):
-                            if face_encoding is None:
-                                continue
-                                
-                            # Compare with known faces
-                            matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=0.6)
-                            name = "Unknown"
-                            
-                            # Find best match
-                            if True in matches:
-                                face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                                best_match_index = np.argmin(face_distances)
-                                
-                                if matches[best_match_index] and face_distances[best_match_index] < 0.6:
-                                    name = self.known_face_names[best_match_index]
-                                    
-                                    # Mark attendance
-                                    if self.mark_attendance(name):
-                                        print(f"✓ Attendance marked for {name}")
-                            
-                            # Draw rectangle and label (scale back up)
-                            top, right, bottom, left = face_location
-                            top *= 4
-                            right *= 4
-                            bottom *= 4
-                            left *= 4
-                            
-                            color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
-                            cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-                            cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
-                            
-                            font = cv2.FONT_HERSHEY_DUPLEX
-                            cv2.putText(frame, name, (left + 6, bottom - 6), font, 0.6, (255, 255, 255), 1)
-                    
-                except Exception as e:
-                    print(f"Error processing frame: {e}")
-                    # Continue to next frame
-                    pass
-            
-            process_this_frame = not process_this_frame
+            try:
+                faces = recognizer.process(frame)
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+                faces = []
+            annotate_frame(frame, faces)
             
             # Display frame
             cv2.imshow('Face Recognition Attendance', frame)
@@ -239,8 +255,27 @@ class FaceRecognitionAttendanceSystem:
         cv2.destroyAllWindows()
         print("Attendance session ended.")
     
+    def process_recording(self, source, stride=15, workers=None, start=None, fps=None):
+        """Mark attendance from a recorded video or frame directory (headless)"""
+        from offline_attendance import process_recording
+        print(f"Processing {source} (every {stride} frames)...")
+        try:
+            first_seen = process_recording(source, self.gallery, self.mark_attendance, stride=stride,
+                                           workers=workers, start=start, fps=fps,
+                                           detector_backend=self.detector_backend,
+                                           scale=self.detection_scale, quality=self.face_quality)
+        except Exception as e:
+            print(f"Error processing recording: {str(e)}")
+            return {}
+        
+        for (_, name), when in sorted(first_seen.items(), key=lambda item: item[1]):
+            print(f"✓ {name} first seen at {when.strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Recognized {len({name for _, name in first_seen})} students")
+        return first_seen
+    
     def test_camera(self):
         """Test camera functionality"""
+        import cv2
         print("Testing camera... Press 'q' to quit")
         video_capture = cv2.VideoCapture(0)
         
@@ -265,11 +300,12 @@ class FaceRecognitionAttendanceSystem:
     
     def generate_attendance_report(self, date=None):
         """Generate attendance report for a specific date"""
+        import pandas as pd
+        self.attendance_writer.flush()
         try:
-            df = pd.read_csv(self.attendance_file)
+            df = pd.DataFrame(self.storage.attendance_records(date), columns=ATTENDANCE_COLUMNS)
             
             if date:
-                df = df[df['Date'] == date]
                 print(f"\n=== Attendance Report for {date} ===")
             else:
                 print(f"\n=== Complete Attendance Report ===")
@@ -280,15 +316,15 @@ class FaceRecognitionAttendanceSystem:
             
             print(df.to_string(index=False))
             
-            # Summary statistics
+            # Summary statistics from the precomputed rollups
             total_students = len(self.students_data)
-            present_today = len(df[df['Date'] == datetime.now().strftime("%Y-%m-%d")]) if not date else len(df)
+            day = self.attendance_summary.day(date or datetime.now().strftime("%Y-%m-%d"), total_students)
             
             print(f"\nSummary:")
             print(f"Total Registered Students: {total_students}")
-            print(f"Present Today: {present_today}")
+            print(f"Present Today: {day['present']}")
             if total_students > 0:
-                print(f"Attendance Percentage: {(present_today/total_students)*100:.1f}%")
+                print(f"Attendance Percentage: {day['percentage']:.1f}%")
             
         except Exception as e:
             print(f"Error generating report: {str(e)}")
@@ -322,16 +358,18 @@ class FaceRecognitionAttendanceSystem:
             if choice == '1':
                 name = input("Enter student name: ")
                 student_id = input("Enter student ID: ")
-                image_path = input("Enter image path: ")
+                image_paths = [path.strip() for path in input("Enter image path(s), comma-separated: ").split(',')
+                               if path.strip()]
                 
-                if not os.path.exists(image_path):
-                    print("Error: Image file not found!")
+                missing = [path for path in image_paths if not os.path.exists(path)]
+                if not image_paths or missing:
+                    print(f"Error: Image file not found! {', '.join(missing)}")
                     continue
                 
-                self.add_student(name, student_id, image_path)
+                self.add_student(name, student_id, image_paths)
             
             elif choice == '2':
-                if not self.known_face_encodings:
+                if not len(self.gallery):
                     print("No students registered yet! Please add students first.")
                     continue
                 self.start_attendance_session()
@@ -356,22 +394,43 @@ class FaceRecognitionAttendanceSystem:
                 print("Invalid choice! Please try again.")
 
 def main():
-    # Check if required packages are installed
-    try:
-        import cv2
-        import face_recognition
-        import numpy as np
-        import pandas as pd
-        print("All required packages are installed.")
-    except ImportError as e:
-        print(f"Missing package: {e}")
+    parser = argparse.ArgumentParser(description="Face recognition attendance system")
+    subparsers = parser.add_subparsers(dest='command')
+    enroll_parser = subparsers.add_parser('enroll', help="Bulk-enroll students from a directory or zip of photos")
+    enroll_parser.add_argument('source', help="Directory or zip archive of <name>_<student_id>.jpg photos")
+    enroll_parser.add_argument('--workers', type=int, default=None, help="Encoding processes (default: CPU count)")
+    enroll_parser.add_argument('--folders', action='store_true',
+                               help="Each <name>_<student_id> subfolder holds one student's photos")
+    process_parser = subparsers.add_parser('process', help="Mark attendance from a recorded video or frame directory")
+    process_parser.add_argument('source', help="Video file or directory of frames")
+    process_parser.add_argument('--stride', type=int, default=15, help="Process every Nth frame")
+    process_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    process_parser.add_argument('--start', type=datetime.fromisoformat, default=None,
+                                help="Recording start, e.g. '2024-01-01 09:00:00' (default: from file times)")
+    process_parser.add_argument('--fps', type=float, default=None,
+                                help="Frame rate (default: from the video; 1 for frame directories)")
+    args = parser.parse_args()
+    
+    # Check if required packages are installed, without importing them
+    missing = [name for name in ('cv2', 'face_recognition', 'numpy', 'pandas')
+               if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"Missing package: {', '.join(missing)}")
         print("Please install required packages:")
         print("pip install opencv-python face-recognition pandas numpy")
         return
+    print("All required packages are installed.")
     
     # Initialize the attendance system
     attendance_system = FaceRecognitionAttendanceSystem()
     
+    if args.command == 'enroll':
+        attendance_system.bulk_enroll(args.source, args.workers, args.folders)
+        return
+    if args.command == 'process':
+        attendance_system.process_recording(args.source, args.stride, args.workers, args.start, args.fps)
+        return
+    
     # Start the menu
     attendance_system.menu()
 
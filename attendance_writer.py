@@ -0,0 +1,113 @@
+import atexit
+import queue
+import threading
+import time
+
+FSYNC_POLICIES = ('batch', 'interval', 'never')
+
+
+class AttendanceWriter:
+    """Background writer that group-commits attendance rows to storage.
+
+    submit() only enqueues, so recognition threads never wait on disk. The
+    writer thread collects rows for up to flush_interval seconds (or
+    batch_size rows), appends them in one storage call and syncs according
+    to the policy: 'batch' after every write, 'interval' at most every
+    fsync_interval seconds, 'never' leaves it to the OS. Dedup stays with
+    the caller, which checks and records (date, name) in the storage
+    before submitting. on_commit, if given, is called with each batch
+    once it is stored.
+    """
+
+    def __init__(self, storage, flush_interval=0.5, batch_size=256, fsync='batch', fsync_interval=5.0,
+                 on_commit=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.storage = storage
+        self.on_commit = on_commit
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.rows_written = 0
+        self.batches_written = 0
+        self._queue = queue.Queue()
+        self._pending = []
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, row):
+        """Queue one row for writing; never blocks"""
+        self._queue.put(row)
+
+    def flush(self, timeout=None):
+        """Wait until every row submitted so far is on disk"""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Write out what is queued and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def pending(self):
+        return self._queue.qsize() + len(self._pending)
+
+    def _run(self):
+        running = True
+        while running:
+            item = self._queue.get()
+            waiters = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, threading.Event):
+                    # Flush requests cut the batch short
+                    waiters.append(item)
+                    break
+                self._pending.append(item)
+                if len(self._pending) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._write_pending(final=not running)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write_pending(self, final=False):
+        if not self._pending:
+            return
+        now = time.monotonic()
+        sync = self.fsync == 'batch' or final or (
+            self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval)
+        try:
+            self.storage.append_attendance(self._pending, sync)
+        except Exception as e:
+            # Keep the rows and retry with the next batch
+            print(f"Error writing attendance: {e}")
+            time.sleep(self.flush_interval)
+            return
+        if sync:
+            self._last_fsync = now
+        self.rows_written += len(self._pending)
+        self.batches_written += 1
+        rows, self._pending = self._pending, []
+        if self.on_commit:
+            try:
+                self.on_commit(rows)
+            except Exception as e:
+                print(f"Error in attendance commit callback: {e}")
@@ -0,0 +1,294 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from ann_index import create_index
+from face_detector import Detections, create_detector, scale_location
+from face_gallery import ENCODING_SIZE, FaceGallery
+from frame_pipeline import annotate_frame
+from metrics import camera_metrics
+from recognition import FrameRecognizer
+from storage import create_storage
+
+# Timed here; resize, detect, track, encode and match are read from
+# FrameRecognizer's own stage metrics for the benchmark camera
+STAGES = ['decode', 'recognize', 'dedup', 'write', 'jpeg']
+RECOGNIZER_STAGES = ['resize', 'detect', 'track', 'encode', 'match']
+BENCHMARK_CAMERA = 'benchmark'
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def synthetic_gallery(size, seed=0):
+    """Random encodings with roughly the spread of real dlib descriptors"""
+    rng = np.random.default_rng(seed)
+    encodings = (rng.standard_normal((size, ENCODING_SIZE)) * 0.09).astype(np.float32)
+    return encodings, [f"student_{i}" for i in range(size)]
+
+
+def synthetic_frames(count, width=640, height=480, faces=3, seed=0):
+    """Return [(jpeg_bytes, boxes)]: noisy frames with face-sized ellipses"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        frame = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+        boxes = []
+        for f in range(faces):
+            cx = int(width * (f + 1) / (faces + 1)) + (i % 7)
+            cy = height // 2
+            cv2.ellipse(frame, (cx, cy), (45, 60), 0, 0, 360, (140, 170, 210), -1)
+            boxes.append((cy - 60, cx + 45, cy + 60, cx - 45))
+        ret, buffer = cv2.imencode('.jpg', frame)
+        frames.append((buffer.tobytes(), boxes))
+    return frames
+
+
+def clip_frames(clip, max_frames):
+    """Return [(jpeg_bytes, None)] from a video file or image directory"""
+    frames = []
+    if os.path.isdir(clip):
+        for name in sorted(os.listdir(clip))[:max_frames]:
+            with open(os.path.join(clip, name), 'rb') as f:
+                frames.append((f.read(), None))
+        return frames
+    capture = cv2.VideoCapture(clip)
+    while len(frames) < max_frames:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append((cv2.imencode('.jpg', frame)[1].tobytes(), None))
+    capture.release()
+    if not frames:
+        raise ValueError(f"Could not read frames from {clip}")
+    return frames
+
+
+def summarize(samples):
+    """Milliseconds: mean, p50, p95 and total for a list of seconds"""
+    if not samples:
+        return {'count': 0}
+    ms = np.asarray(samples) * 1000.0
+    return {
+        'count': len(ms),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'total_ms': round(float(ms.sum()), 1),
+    }
+
+
+class SyntheticBoxDetector:
+    """Wraps a detector; frames where it finds nobody get the synthetic face boxes.
+
+    Synthetic faces are not real faces, so their boxes are fed to the
+    recognizer anyway to exercise encoding and matching.
+    """
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.boxes = None
+
+    def detect(self, frame):
+        detections = self.detector.detect(frame)
+        if detections.locations or not self.boxes:
+            return detections
+        scale = detections.scale
+        small_locations = [tuple(int(v * scale) for v in box) for box in self.boxes]
+        return Detections(detections.rgb, small_locations,
+                          [scale_location(location, 1.0 / scale) for location in small_locations], scale,
+                          detections.resize_seconds)
+
+
+def bench_pipeline(frames, gallery, storage, detector_backend='hog', scale=0.25):
+    """Run FrameRecognizer.process, the live recognition hot path, over pre-encoded frames"""
+    detector = SyntheticBoxDetector(create_detector(detector_backend, scale=scale))
+    timings = {stage: [] for stage in STAGES}
+    date = datetime.now().strftime("%Y-%m-%d")
+
+    def on_match(name):
+        t = time.perf_counter()
+        marked = storage.is_marked(name, date)
+        timings['dedup'].append(time.perf_counter() - t)
+        if not marked:
+            t = time.perf_counter()
+            storage.add_marked(name, date)
+            storage.append_attendance([[name, name, date, '09:00:00', 'Present']])
+            timings['write'].append(time.perf_counter() - t)
+
+    recognizer = FrameRecognizer(gallery, on_match, detector, detect_interval=1, camera_id=BENCHMARK_CAMERA)
+    faces = 0
+    started = time.perf_counter()
+    for jpeg, boxes in frames:
+        t = time.perf_counter()
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        timings['decode'].append(time.perf_counter() - t)
+
+        detector.boxes = boxes
+        t = time.perf_counter()
+        located = recognizer.process(frame)
+        timings['recognize'].append(time.perf_counter() - t)
+        faces += len(located)
+
+        t = time.perf_counter()
+        ret, buffer = cv2.imencode('.jpg', annotate_frame(frame, located))
+        timings['jpeg'].append(time.perf_counter() - t)
+
+    elapsed = time.perf_counter() - started
+    stages = {stage: summarize(samples) for stage, samples in timings.items()}
+    # Histogram estimates, from the recognizer's own instrumentation
+    recognizer_stages = camera_metrics(BENCHMARK_CAMERA)['stages']
+    stages.update({stage: recognizer_stages.get(stage, {'count': 0}) for stage in RECOGNIZER_STAGES})
+    return {
+        'frames': len(frames),
+        'faces': faces,
+        'fps': round(len(frames) / elapsed, 2) if elapsed else None,
+        'stages': stages,
+        'recognition': recognizer.stats(),
+    }
+
+
+def bench_matching(sizes, index_kinds=('exact', 'auto'), queries=64, seed=0):
+    """Match latency against synthetic galleries of each size"""
+    rng = np.random.default_rng(seed + 1)
+    results = []
+    for size in sizes:
+        encodings, names = synthetic_gallery(size, seed)
+        picks = rng.integers(0, size, queries)
+        probe = encodings[picks] + (rng.standard_normal((queries, ENCODING_SIZE)) * 0.01).astype(np.float32)
+        for kind in index_kinds:
+            gallery = FaceGallery(tolerance=0.6)
+            gallery.add_many(encodings, names)
+            started = time.perf_counter()
+            gallery.attach_index(create_index(kind))
+            build = time.perf_counter() - started
+
+            samples = []
+            hits = 0
+            for query, pick in zip(probe, picks):
+                t = time.perf_counter()
+                name = gallery.match_names([query])[0]
+                samples.append(time.perf_counter() - t)
+                hits += name == names[pick]
+            results.append(dict(summarize(samples), gallery_size=size, index=kind,
+                                index_build_ms=round(build * 1000, 1),
+                                recall=round(hits / queries, 3), peak_rss_mb=peak_rss_mb()))
+            del gallery
+    return results
+
+
+def bench_storage(backend, history, directory):
+    """Dedup and single-row write latency with `history` rows already stored"""
+    paths = {
+        'students_db': os.path.join(directory, f"{backend}_students.json"),
+        'attendance_file': os.path.join(directory, f"{backend}_attendance.csv"),
+        'encodings_base': os.path.join(directory, f"{backend}_encodings"),
+        'encodings_pickle': os.path.join(directory, "missing.pkl"),
+    }
+    storage = create_storage(backend, database_file=os.path.join(directory, "bench.db"), **paths)
+    rows = [[f"student_{i % 5000}", i % 5000, f"2024-{1 + i // 5000 % 12:02d}-{1 + i // 60000 % 28:02d}",
+             '09:00:00', 'Present'] for i in range(history)]
+    for start in range(0, history, 50000):
+        storage.append_attendance(rows[start:start + 50000], sync=False)
+
+    dedup, write = [], []
+    for i in range(200):
+        t = time.perf_counter()
+        storage.is_marked(f"student_{i}", "2030-01-01")
+        dedup.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        storage.append_attendance([[f"student_{i}", i, "2030-01-01", '09:00:00', 'Present']])
+        write.append(time.perf_counter() - t)
+    return {'backend': backend, 'history': history, 'dedup': summarize(dedup), 'write': summarize(write)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(clip=None, max_frames=100, gallery_sizes=(100, 1000, 10000, 100000), pipeline_gallery=1000,
+        detector_backend='hog', scale=0.25, history=100000, backends=('files', 'sqlite')):
+    frames = clip_frames(clip, max_frames) if clip else synthetic_frames(max_frames)
+    encodings, names = synthetic_gallery(pipeline_gallery)
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'cpus': os.cpu_count()},
+        'input': clip or f"synthetic:{max_frames}",
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        storage = create_storage('files', students_db=os.path.join(directory, "students.json"),
+                                 attendance_file=os.path.join(directory, "attendance.csv"),
+                                 encodings_base=os.path.join(directory, "encodings"),
+                                 encodings_pickle=os.path.join(directory, "missing.pkl"))
+        results['pipeline'] = dict(bench_pipeline(frames, FaceGallery(encodings, names), storage,
+                                                  detector_backend, scale),
+                                   gallery_size=pipeline_gallery, detector=detector_backend, scale=scale)
+        results['storage'] = [bench_storage(backend, history, directory) for backend in backends]
+    results['matching'] = bench_matching(gallery_sizes)
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def print_report(results):
+    pipeline = results['pipeline']
+    print(f"Commit {results['commit']}  input {results['input']}  "
+          f"{pipeline['frames']} frames, {pipeline['faces']} faces, {pipeline['fps']} fps")
+    print(f"{'stage':>9} {'mean ms':>9} {'p95 ms':>9} {'count':>7}")
+    for stage, stats in pipeline['stages'].items():
+        if stats['count']:
+            print(f"{stage:>9} {stats['mean_ms']:9.3f} {stats['p95_ms']:9.3f} {stats['count']:7}")
+    print()
+    for result in results['storage']:
+        print(f"{result['backend']:>8} storage, {result['history']} rows: dedup {result['dedup']['mean_ms']:.3f} ms, "
+              f"write {result['write']['mean_ms']:.3f} ms")
+    print()
+    print(f"{'gallery':>9} {'index':>6} {'build ms':>10} {'ms/query':>9} {'p95 ms':>8} {'recall':>7} {'RSS MB':>8}")
+    for result in results['matching']:
+        print(f"{result['gallery_size']:>9} {result['index']:>6} {result['index_build_ms']:>10} "
+              f"{result['mean_ms']:>9.3f} {result['p95_ms']:>8.3f} {result['recall']:>7} {result['peak_rss_mb']:>8}")
+    print(f"\nPeak RSS: {results['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline CPU benchmark of the recognition hot path")
+    parser.add_argument('--clip', default=None, help="Video file or image directory (default: synthetic frames)")
+    parser.add_argument('--max-frames', type=int, default=100)
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help="Synthetic gallery sizes for the matching benchmark (up to 1000000)")
+    parser.add_argument('--pipeline-gallery', type=int, default=1000, help="Gallery size for the frame loop")
+    parser.add_argument('--detector', default='hog', help="Detector backend for the frame loop")
+    parser.add_argument('--scale', type=float, default=0.25, help="Downscale factor before detection")
+    parser.add_argument('--history', type=int, default=100000, help="Attendance rows stored before timing dedup/write")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('--output', default=None, help="Also write JSON results to this file")
+    args = parser.parse_args()
+
+    results = run(args.clip, args.max_frames, args.gallery_sizes, args.pipeline_gallery,
+                  args.detector, args.scale, args.history)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
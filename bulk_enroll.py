@@ -0,0 +1,156 @@
+import csv
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import face_recognition
+
+from face_quality import sample_quality
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+MANIFEST_FILE = "manifest.csv"
+
+
+def parse_image_name(path):
+    """Split "<name>_<student_id>.jpg" (the /add_student naming) into its parts.
+
+    A numbered extra photo of the same student, "<name>_<student_id>.2.jpg",
+    parses the same way.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return parse_stem(re.sub(r'\.\d+$', '', stem))
+
+
+def parse_stem(stem):
+    name, sep, student_id = stem.rpartition('_')
+    if not sep or not name:
+        return stem, stem
+    return name.replace('_', ' '), student_id
+
+
+def safe_member_path(name):
+    """Relative path of an archive member with empty, '.', '..' and drive parts dropped"""
+    parts = [part.replace(':', '_') for part in re.split(r'[\\/]+', name) if part not in ('', '.', '..')]
+    return os.path.join(*parts) if parts else None
+
+
+def extract_zip(zip_path, target_dir):
+    """Extract the images (and manifest) of a zip archive into target_dir.
+
+    Folders are kept, sanitized, so photos with the same file name in
+    different folders do not overwrite each other. Returns the directory
+    to collect from: the archive's single top-level folder if everything
+    is wrapped in one, else target_dir.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    tops = set()
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in archive.infolist():
+            path = safe_member_path(member.filename)
+            if member.is_dir() or path is None:
+                continue
+            filename = os.path.basename(path)
+            extension = os.path.splitext(filename)[1].lower()
+            if extension not in IMAGE_EXTENSIONS and filename != MANIFEST_FILE:
+                continue
+            destination = os.path.join(target_dir, path)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with archive.open(member) as src, open(destination, 'wb') as dst:
+                dst.write(src.read())
+            tops.add(path.split(os.sep)[0] if os.sep in path else None)
+    if len(tops) == 1 and None not in tops:
+        return os.path.join(target_dir, tops.pop())
+    return target_dir
+
+
+def collect_images(directory, per_student_folders=False):
+    """List (name, student_id, image_path) entries for a directory of photos.
+
+    A manifest.csv with name,student_id,image columns takes precedence over
+    the file naming convention. With per_student_folders, photos inside a
+    "<name>_<student_id>" subfolder all belong to that student whatever
+    their file names; otherwise folders are only for organizing and every
+    photo is parsed by its own name.
+    """
+    manifest = os.path.join(directory, MANIFEST_FILE)
+    if os.path.exists(manifest):
+        with open(manifest, newline='') as f:
+            return [(row['name'], row['student_id'], os.path.join(directory, row['image']))
+                    for row in csv.DictReader(f)]
+
+    entries = []
+    for root, _, files in os.walk(directory):
+        for filename in sorted(files):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                path = os.path.join(root, filename)
+                folder = os.path.basename(root)
+                if per_student_folders and root != directory and '_' in folder:
+                    name, student_id = parse_stem(folder)
+                else:
+                    name, student_id = parse_image_name(path)
+                entries.append((name, student_id, path))
+    return entries
+
+
+def collect_source(source, extract_dir, per_student_folders=False):
+    """Entries for a directory, or for a zip archive extracted into extract_dir"""
+    if os.path.isdir(source):
+        return collect_images(source, per_student_folders)
+    if zipfile.is_zipfile(source):
+        return collect_images(extract_zip(source, extract_dir), per_student_folders)
+    raise ValueError(f"{source} is neither a directory nor a zip archive")
+
+
+def encode_image(image_path):
+    """Worker: return ((encoding, quality), error) for a single enrollment photo"""
+    try:
+        image = face_recognition.load_image_file(image_path)
+        locations = face_recognition.face_locations(image)
+        if len(locations) == 0:
+            return None, "No face detected"
+        if len(locations) > 1:
+            return None, f"Multiple faces detected ({len(locations)})"
+        encoding = face_recognition.face_encodings(image, locations)[0]
+        return (encoding, sample_quality(image, locations[0])), None
+    except Exception as e:
+        return None, str(e)
+
+
+def encode_images(entries, workers=None):
+    """Encode entries across a process pool.
+
+    Returns (enrolled, failures): enrolled is a list of
+    (name, student_id, image_path, encoding, quality), failures a list of
+    dicts describing each image that could not be used.
+    """
+    paths = [image_path for _, _, image_path in entries]
+    chunksize = max(1, len(paths) // (4 * (workers or os.cpu_count() or 1)))
+    # Spawned, not forked: the web app starts jobs from a thread, and a
+    # forked child could inherit a lock some other thread was holding
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        results = list(pool.map(encode_image, paths, chunksize=chunksize))
+
+    enrolled = []
+    failures = []
+    for (name, student_id, image_path), (sample, error) in zip(entries, results):
+        if error:
+            failures.append({'name': name, 'student_id': student_id, 'image': image_path, 'error': error})
+        else:
+            enrolled.append((name, student_id, image_path) + sample)
+    return enrolled, failures
+
+
+def group_by_student(enrolled):
+    """Group encode_images() results per student_id.
+
+    Returns (name, student_id, image_path, encodings, qualities) per
+    student, in first-seen order; image_path is the first photo.
+    """
+    students = {}
+    for name, student_id, image_path, encoding, quality in enrolled:
+        student = students.setdefault(student_id, (name, student_id, image_path, [], []))
+        student[3].append(encoding)
+        student[4].append(quality)
+    return list(students.values())
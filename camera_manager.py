@@ -0,0 +1,222 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from frame_pipeline import FramePipeline
+from metrics import camera_metrics
+
+
+class FileCapture:
+    """Plays a video file like a live camera: paced at its frame rate, looping"""
+
+    def __init__(self, path):
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        self.interval = 1.0 / (self.capture.get(cv2.CAP_PROP_FPS) or 25.0)
+        self._next_frame = time.monotonic()
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self):
+        delay = self._next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_frame = max(self._next_frame, time.monotonic() - self.interval) + self.interval
+        ret, frame = self.capture.read()
+        if not ret:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        return ret, frame
+
+    def release(self):
+        self.capture.release()
+
+
+class StreamCapture:
+    """Network stream (RTSP/HTTP) that reconnects with backoff when it drops.
+
+    A failed read closes the stream and reopens it, waiting retry_delay
+    seconds, doubling up to max_retry_delay, between attempts. read() only
+    gives up once interrupt() or release() has been called.
+    """
+
+    def __init__(self, url, retry_delay=0.5, max_retry_delay=30.0):
+        self.url = url
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.reconnects = 0
+        self.capture = cv2.VideoCapture(url)
+        self._released = threading.Event()
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self):
+        ret, frame = self.capture.read()
+        delay = self.retry_delay
+        while not ret and not self._released.is_set():
+            print(f"Lost stream {self.url}, reconnecting in {delay:.1f}s")
+            self.capture.release()
+            if self._released.wait(delay):
+                break
+            delay = min(delay * 2, self.max_retry_delay)
+            self.capture = cv2.VideoCapture(self.url)
+            ret, frame = self.capture.read()
+            if ret:
+                self.reconnects += 1
+                print(f"Reconnected to {self.url}")
+        return ret, frame
+
+    def interrupt(self):
+        """Stop reconnecting, so a read() waiting to retry returns at once"""
+        self._released.set()
+
+    def release(self):
+        self._released.set()
+        self.capture.release()
+
+
+def open_capture(source):
+    """Open a device index, a video file or a stream URL (RTSP/HTTP)"""
+    if isinstance(source, int) or str(source).isdigit():
+        capture = cv2.VideoCapture(int(source))
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        return capture
+    if os.path.isfile(source):
+        return FileCapture(source)
+    if '://' in str(source):
+        return StreamCapture(source)
+    return cv2.VideoCapture(source)
+
+
+def load_camera_sources(cameras_file, default=None):
+    """Read {camera_id: source} from a JSON file, falling back to one default camera"""
+    try:
+        with open(cameras_file, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default if default is not None else {'default': 0}
+
+
+class CameraSource:
+    """One named camera with its own capture thread and per-room session state"""
+
+    def __init__(self, camera_id, source, manager):
+        self.camera_id = camera_id
+        self.source = source
+        self.manager = manager
+        self.capture = None
+        self.pipeline = None
+        self.recognizer = None
+        self.is_streaming = False
+        self.attendance_session_active = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Open the source and start its pipeline; False if already running"""
+        with self._lock:
+            if self.is_streaming:
+                return False
+            self.capture = open_capture(self.source)
+            if not self.capture.isOpened():
+                self.capture.release()
+                self.capture = None
+                raise IOError(f"Could not open camera source {self.source}")
+            self.recognizer = self.manager.create_recognizer(self.camera_id)
+            pipeline = FramePipeline(self.capture, self.recognizer.process,
+                                     active=lambda: self.attendance_session_active,
+                                     stream_fps=self.manager.stream_fps,
+                                     recognition_fps=self.manager.recognition_fps,
+                                     executor=self.manager.executor,
+                                     max_in_flight=self.manager.max_in_flight,
+                                     camera_id=self.camera_id,
+                                     on_stop=lambda: self._capture_ended(pipeline))
+            self.pipeline = pipeline
+            self.pipeline.start()
+            self.is_streaming = True
+            return True
+
+    def stop(self):
+        """Stop the pipeline and release the source; False if not running"""
+        with self._lock:
+            if not self.is_streaming:
+                return False
+            self._release()
+            return True
+
+    def _capture_ended(self, pipeline):
+        """The pipeline's camera stopped delivering frames: mark the camera stopped"""
+        with self._lock:
+            # Ignore a late call from a pipeline this camera already replaced
+            if self.is_streaming and self.pipeline is pipeline:
+                self._release()
+
+    def _release(self):
+        if isinstance(self.capture, StreamCapture):
+            self.capture.interrupt()
+        self.pipeline.stop()
+        self.capture.release()
+        self.is_streaming = False
+        self.attendance_session_active = False
+
+    def start_attendance(self):
+        if not self.is_streaming:
+            return False
+        self.attendance_session_active = True
+        return True
+
+    def stop_attendance(self):
+        self.attendance_session_active = False
+
+    def status(self):
+        return {
+            'camera_running': self.is_streaming,
+            'attendance_active': self.attendance_session_active,
+            'pipeline': self.pipeline.stats() if self.is_streaming else None,
+            'recognition': self.recognizer.stats() if self.is_streaming else None,
+            'metrics': camera_metrics(self.camera_id),
+        }
+
+
+class SessionManager:
+    """Owns every camera source and the recognition pool they share.
+
+    create_recognizer is called once per camera start, so each room keeps
+    its own tracker while the gallery and attendance log stay shared.
+    """
+
+    def __init__(self, create_recognizer, sources, stream_fps=15, recognition_fps=5, workers=2,
+                 max_in_flight=2):
+        self.create_recognizer = create_recognizer
+        self.stream_fps = stream_fps
+        self.recognition_fps = recognition_fps
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognition')
+        self.cameras = {}
+        for camera_id, source in sources.items():
+            self.add_source(camera_id, source)
+
+    @property
+    def default_id(self):
+        return next(iter(self.cameras), None)
+
+    def add_source(self, camera_id, source):
+        self.cameras[camera_id] = CameraSource(camera_id, source, self)
+        return self.cameras[camera_id]
+
+    def get(self, camera_id=None):
+        """Camera by id; None selects the first configured camera"""
+        return self.cameras.get(camera_id if camera_id is not None else self.default_id)
+
+    def stop_all(self):
+        for camera in self.cameras.values():
+            camera.stop()
+
+    def status(self):
+        return {camera_id: camera.status() for camera_id, camera in self.cameras.items()}
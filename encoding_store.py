@@ -0,0 +1,177 @@
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+
+from face_gallery import ENCODING_SIZE
+from file_lock import file_lock
+
+ROW_BYTES = ENCODING_SIZE * 4
+
+
+class EncodingStore:
+    """Append-only on-disk face encodings.
+
+    <base>.f32 holds fixed-width float32 rows and is memory-mapped on load;
+    <base>.names.jsonl holds one {"name", "student_id"} line per row, plus
+    "kind" and "quality" for template rows (see face_templates.py). Adding
+    a student appends rows to each file instead of rewriting both.
+
+    Appends and repairs hold an exclusive flock on <base>.lock, so several
+    processes (e.g. gunicorn workers) can enroll at once; readers without
+    the lock ignore trailing rows that are not in both files yet.
+    """
+
+    def __init__(self, base_path):
+        self.data_file = base_path + ".f32"
+        self.names_file = base_path + ".names.jsonl"
+        self.lock_file = base_path + ".lock"
+        # Rows and names bytes seen by the last load()/load_new()
+        self.rows = 0
+        self._names_offset = 0
+
+    def exists(self):
+        return os.path.exists(self.data_file) and os.path.exists(self.names_file)
+
+    def _read_names(self, start=0):
+        entries = []
+        offsets = []
+        end = start
+        with open(self.names_file, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+                end += len(line)
+                offsets.append(end)
+        return entries, offsets
+
+    def load(self):
+        """Return (encodings, entries); encodings is a read-only memmap"""
+        if not self.exists():
+            return np.empty((0, ENCODING_SIZE), dtype=np.float32), []
+
+        with file_lock(self.lock_file):
+            # No append can be in progress, so a mismatch is left over from a crash
+            self._repair()
+            entries, offsets = self._read_names()
+            rows = min(os.path.getsize(self.data_file) // ROW_BYTES, len(entries))
+        self.rows = rows
+        self._names_offset = offsets[rows - 1] if rows else 0
+        return self._map(rows), entries[:rows]
+
+    def _map(self, rows):
+        if rows == 0:
+            return np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        return np.memmap(self.data_file, dtype=np.float32, mode='r', shape=(rows, ENCODING_SIZE))
+
+    def changed(self):
+        """True when rows were appended (by any process) since the last load"""
+        try:
+            return os.path.getsize(self.names_file) > self._names_offset
+        except OSError:
+            return False
+
+    def load_new(self):
+        """Return (encodings, new_entries) for rows appended since the last load.
+
+        encodings maps the whole file read-only again, so every process shares
+        the same page-cache copy; only the names of the new rows are read. A
+        row still being appended by another process is left for the next call.
+        """
+        if not self.exists():
+            return self._map(0), []
+        entries, offsets = self._read_names(self._names_offset)
+        entries = entries[:max(0, os.path.getsize(self.data_file) // ROW_BYTES - self.rows)]
+        if entries:
+            self.rows += len(entries)
+            self._names_offset = offsets[len(entries) - 1]
+        return self._map(self.rows), entries
+
+    def _repair(self):
+        # Only with the lock held: an interrupted append can leave one file
+        # ahead of the other, so cut both back to the rows complete in both
+        with open(self.names_file, 'rb') as f:
+            names = f.read()
+        lines = names.count(b'\n')
+        rows = min(os.path.getsize(self.data_file) // ROW_BYTES, lines)
+        if os.path.getsize(self.data_file) != rows * ROW_BYTES:
+            with open(self.data_file, 'r+b') as f:
+                f.truncate(rows * ROW_BYTES)
+        names_bytes = names.rfind(b'\n') + 1
+        for _ in range(lines - rows):
+            names_bytes = names.rfind(b'\n', 0, names_bytes - 1) + 1
+        if len(names) != names_bytes:
+            with open(self.names_file, 'r+b') as f:
+                f.truncate(names_bytes)
+
+    def rows_for(self, names):
+        """{name: (encodings, entries)} of every stored row of several students.
+
+        The names file is read once however many students are asked for.
+        """
+        wanted = {name: [] for name in names}
+        if not self.exists():
+            return {name: (np.empty((0, ENCODING_SIZE), dtype=np.float32), []) for name in wanted}
+        entries, _ = self._read_names()
+        encodings = self._map(min(os.path.getsize(self.data_file) // ROW_BYTES, len(entries)))
+        for row, entry in enumerate(entries[:len(encodings)]):
+            if entry.get('name') in wanted:
+                wanted[entry['name']].append(row)
+        return {name: (np.array(encodings[rows]).reshape(-1, ENCODING_SIZE), [entries[row] for row in rows])
+                for name, rows in wanted.items()}
+
+    def append(self, encodings, names, student_ids=None, kinds=None, qualities=None):
+        """Append rows to both files"""
+        rows = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        count = len(rows)
+        entries = [{'name': name, 'student_id': student_id}
+                   for name, student_id in zip(names, student_ids or [None] * count)]
+        for entry, kind, quality in zip(entries, kinds or [None] * count, qualities or [None] * count):
+            if kind is not None:
+                entry['kind'] = kind
+                entry['quality'] = quality
+        lines = ''.join(json.dumps(entry) + '\n' for entry in entries)
+
+        with file_lock(self.lock_file):
+            # Rows left by an append that crashed would shift every later row
+            if self.exists():
+                self._repair()
+            # Encodings first: readers only count rows that also have a name
+            with open(self.data_file, 'ab') as f:
+                f.write(rows.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.names_file, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def migrate_from_pickle(self, pickle_file, students_data=None):
+        """One-shot conversion of a legacy face_encodings.pkl"""
+        with open(pickle_file, 'rb') as f:
+            data = pickle.load(f)
+        students_data = students_data or {}
+        names = list(data['names'])
+        student_ids = [students_data.get(name, {}).get('student_id') for name in names]
+
+        with file_lock(self.lock_file):
+            for path in (self.data_file, self.names_file):
+                open(path, 'wb').close()
+        if names:
+            self.append(data['encodings'], names, student_ids)
+        print(f"Migrated {len(names)} face encodings from {pickle_file}")
+        return len(names)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python encoding_store.py <face_encodings.pkl> <output base path>")
+        sys.exit(1)
+    EncodingStore(sys.argv[2]).migrate_from_pickle(sys.argv[1])
@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import face_recognition
+
+# rgb: downscaled RGB frame, small_locations: boxes in rgb, locations: boxes in
+# the original frame, scale: factor used for this frame, resize_seconds: time
+# spent downscaling and converting the frame, reported as its own stage
+Detections = namedtuple('Detections', ['rgb', 'small_locations', 'locations', 'scale', 'resize_seconds'],
+                        defaults=(0.0,))
+
+
+def scale_location(location, factor):
+    """Scale a (top, right, bottom, left) box"""
+    return tuple(int(round(v * factor)) for v in location)
+
+
+class FaceDetector:
+    """Base class for detector backends.
+
+    Handles the downscale before detection and the rescale of results back to
+    frame coordinates. With adaptive=True the scale follows the smallest face
+    seen so it stays near target_face_size pixels after downscaling: large
+    faces close to the camera shrink the scale, small faces in the back rows
+    grow it, within [min_scale, max_scale]. Frames with no faces ease it back
+    towards the configured scale.
+    """
+
+    name = None
+
+    def __init__(self, scale=0.25, adaptive=False, min_scale=0.2, max_scale=1.0, target_face_size=48):
+        self.scale = scale
+        self.base_scale = scale
+        self.adaptive = adaptive
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.target_face_size = target_face_size
+
+    def detect(self, frame):
+        """Detect faces in a BGR frame"""
+        scale = self.scale
+        started = time.perf_counter()
+        small = cv2.resize(frame, (0, 0), fx=scale, fy=scale) if scale != 1.0 else frame
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        resize_seconds = time.perf_counter() - started
+        small_locations = self._detect(small, rgb)
+        if self.adaptive:
+            self._adapt(small_locations)
+        locations = [scale_location(location, 1.0 / scale) for location in small_locations]
+        return Detections(rgb, small_locations, locations, scale, resize_seconds)
+
+    def _adapt(self, small_locations):
+        if small_locations:
+            smallest = min(bottom - top for top, _, bottom, _ in small_locations)
+            wanted = self.scale * self.target_face_size / max(smallest, 1)
+        else:
+            # Nobody in view: an empty room is no reason to zoom in
+            wanted = self.base_scale
+        wanted = min(max(wanted, self.min_scale), self.max_scale)
+        self.scale = round(0.7 * self.scale + 0.3 * wanted, 3)
+
+    def _detect(self, bgr, rgb):
+        raise NotImplementedError
+
+
+class HOGDetector(FaceDetector):
+    """dlib HOG (or CNN) detector through face_recognition"""
+
+    name = 'hog'
+
+    def __init__(self, upsample=1, model='hog', **kwargs):
+        super().__init__(**kwargs)
+        self.upsample = upsample
+        self.model = model
+
+    def _detect(self, bgr, rgb):
+        return face_recognition.face_locations(rgb, number_of_times_to_upsample=self.upsample, model=self.model)
+
+
+def _clip(box, width, height):
+    top, right, bottom, left = box
+    return (max(0, top), min(width - 1, right), min(height - 1, bottom), max(0, left))
+
+
+class DNNDetector(FaceDetector):
+    """OpenCV DNN res10 SSD (Caffe) face detector"""
+
+    name = 'dnn'
+
+    def __init__(self, prototxt="models/deploy.prototxt",
+                 weights="models/res10_300x300_ssd_iter_140000.caffemodel", confidence=0.5, **kwargs):
+        super().__init__(**kwargs)
+        if not (os.path.exists(prototxt) and os.path.exists(weights)):
+            raise FileNotFoundError(f"DNN face model not found ({prototxt}, {weights})")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+        self.confidence = confidence
+        self._lock = threading.Lock()
+
+    def _detect(self, bgr, rgb):
+        height, width = bgr.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(bgr, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+        with self._lock:
+            self.net.setInput(blob)
+            output = self.net.forward()
+
+        locations = []
+        for detection in output[0, 0]:
+            if detection[2] < self.confidence:
+                continue
+            left, top, right, bottom = (detection[3:7] * [width, height, width, height]).astype(int)
+            locations.append(_clip((top, right, bottom, left), width, height))
+        return locations
+
+
+class YuNetDetector(FaceDetector):
+    """OpenCV YuNet (cv2.FaceDetectorYN) detector"""
+
+    name = 'yunet'
+
+    def __init__(self, model="models/face_detection_yunet_2023mar.onnx", confidence=0.6, **kwargs):
+        super().__init__(**kwargs)
+        if not os.path.exists(model):
+            raise FileNotFoundError(f"YuNet model not found ({model})")
+        self.net = cv2.FaceDetectorYN.create(model, "", (320, 320), confidence)
+        self._lock = threading.Lock()
+
+    def _detect(self, bgr, rgb):
+        height, width = bgr.shape[:2]
+        with self._lock:
+            self.net.setInputSize((width, height))
+            _, faces = self.net.detect(bgr)
+        if faces is None:
+            return []
+        return [_clip((int(y), int(x + w), int(y + h), int(x)), width, height)
+                for x, y, w, h in faces[:, :4]]
+
+
+class HaarDetector(FaceDetector):
+    """OpenCV Haar cascade detector (fastest, least accurate)"""
+
+    name = 'haar'
+
+    def __init__(self, cascade=None, min_neighbors=5, **kwargs):
+        super().__init__(**kwargs)
+        cascade = cascade or os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+        self.classifier = cv2.CascadeClassifier(cascade)
+        if self.classifier.empty():
+            raise FileNotFoundError(f"Haar cascade not found ({cascade})")
+        self.min_neighbors = min_neighbors
+        self._lock = threading.Lock()
+
+    def _detect(self, bgr, rgb):
+        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        with self._lock:
+            boxes = self.classifier.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=self.min_neighbors,
+                                                     minSize=(20, 20))
+        return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in boxes]
+
+
+DETECTORS = {
+    'hog': HOGDetector,
+    'dnn': DNNDetector,
+    'yunet': YuNetDetector,
+    'haar': HaarDetector,
+}
+
+
+def create_detector(backend='hog', **kwargs):
+    """Create a detector by backend name ('hog', 'dnn', 'yunet', 'haar')"""
+    if backend == 'cnn':
+        return HOGDetector(model='cnn', **kwargs)
+    if backend not in DETECTORS:
+        raise ValueError(f"Unknown detector backend: {backend}")
+    return DETECTORS[backend](**kwargs)
+
+
+def benchmark(clip, backends, scale=0.25, max_frames=300):
+    """Run each backend over the same clip; returns one result dict per backend"""
+    capture = cv2.VideoCapture(clip)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    if not frames:
+        raise ValueError(f"Could not read frames from {clip}")
+
+    results = []
+    for backend in backends:
+        try:
+            detector = create_detector(backend, scale=scale)
+        except (FileNotFoundError, ValueError) as e:
+            results.append({'backend': backend, 'error': str(e)})
+            continue
+        faces = 0
+        started = time.perf_counter()
+        for frame in frames:
+            faces += len(detector.detect(frame).locations)
+        elapsed = time.perf_counter() - started
+        results.append({
+            'backend': backend,
+            'frames': len(frames),
+            'faces': faces,
+            'ms_per_frame': round(1000 * elapsed / len(frames), 2),
+            'fps': round(len(frames) / elapsed, 1),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark face detector backends on a video clip")
+    parser.add_argument('clip', help="Video file to run every backend on")
+    parser.add_argument('--backends', nargs='+', default=list(DETECTORS), help="Backends to compare")
+    parser.add_argument('--scale', type=float, default=0.25, help="Downscale factor before detection")
+    parser.add_argument('--max-frames', type=int, default=300)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = benchmark(args.clip, args.backends, args.scale, args.max_frames)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            if 'error' in result:
+                print(f"{result['backend']:>6}: {result['error']}")
+            else:
+                print(f"{result['backend']:>6}: {result['ms_per_frame']:8.2f} ms/frame "
+                      f"{result['fps']:7.1f} fps  {result['faces']} faces in {result['frames']} frames")
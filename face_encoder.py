@@ -0,0 +1,59 @@
+import dlib
+import numpy as np
+from face_recognition import api as face_api
+
+
+def encode_frames(frames, num_jitters=1, gate=None):
+    """Encode every face of several frames with one dlib descriptor call.
+
+    frames is a list of (rgb_image, locations). Returns one list per frame
+    with an encoding (or None when that face failed) per location. With a
+    QualityGate (see face_quality.py), faces it rejects are not encoded and
+    also come back as None.
+    """
+    results = [[None] * len(locations) for _, locations in frames]
+    images, detections, slots = [], [], []
+    for f, (image, locations) in enumerate(frames):
+        shapes = dlib.full_object_detections()
+        frame_slots = []
+        for i, location in enumerate(locations):
+            if gate is not None and gate.check(image, location):
+                continue
+            try:
+                shape = face_api.pose_predictor_5_point(image, face_api._css_to_rect(location))
+            except Exception as e:
+                print(f"Error encoding face: {e}")
+                continue
+            if gate is not None and gate.check_pose(shape):
+                continue
+            shapes.append(shape)
+            frame_slots.append((f, i))
+        if frame_slots:
+            images.append(image)
+            detections.append(shapes)
+            slots.append(frame_slots)
+
+    if not images:
+        return results
+
+    try:
+        batch = face_api.face_encoder.compute_face_descriptor(images, detections, num_jitters)
+        for frame_slots, descriptors in zip(slots, batch):
+            for (f, i), descriptor in zip(frame_slots, descriptors):
+                results[f][i] = np.array(descriptor)
+    except Exception:
+        # Fall back to one call per face so a bad crop only loses itself
+        for image, shapes, frame_slots in zip(images, detections, slots):
+            for (f, i), shape in zip(frame_slots, shapes):
+                try:
+                    results[f][i] = np.array(face_api.face_encoder.compute_face_descriptor(image, shape, num_jitters))
+                except Exception as e:
+                    print(f"Error encoding face: {e}")
+    return results
+
+
+def encode_faces(rgb_image, locations, num_jitters=1, gate=None):
+    """Encode all faces of one frame; failed or rejected faces come back as None"""
+    if not locations:
+        return []
+    return encode_frames([(rgb_image, locations)], num_jitters, gate)[0]
@@ -0,0 +1,225 @@
+import os
+import threading
+
+import numpy as np
+
+ENCODING_SIZE = 128
+
+
+class FaceGallery:
+    """Known face encodings held as one contiguous float32 matrix.
+
+    Squared norms are computed once per row so matching a whole frame is a
+    single matrix product instead of a Python loop over encodings. Galleries
+    with at least exact_threshold rows are matched through an attached ANN
+    index (see ann_index.py) instead of a full scan.
+    """
+
+    def __init__(self, encodings=None, names=None, tolerance=0.6, index=None, exact_threshold=20000):
+        self.tolerance = tolerance
+        self.index = index
+        self.index_path = None
+        self.exact_threshold = exact_threshold
+        self.names = []
+        self._matrix = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._size = 0
+        # Rows excluded from matching, e.g. replaced student templates
+        self._retired = set()
+        self._lock = threading.Lock()
+        if encodings is not None and len(encodings):
+            self.add_many(encodings, names)
+
+    @classmethod
+    def from_matrix(cls, matrix, names, **kwargs):
+        """Wrap an existing float32 matrix (e.g. a memmap) without copying it.
+
+        Row norms are computed on first use and the matrix is only copied
+        into a growable buffer when the first new face is added.
+        """
+        gallery = cls(**kwargs)
+        gallery._matrix = matrix
+        gallery._norms = None
+        gallery.names = list(names)
+        gallery._size = len(matrix)
+        return gallery
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def encodings(self):
+        """View of the stored encodings (size x 128)"""
+        return self._matrix[:self._size]
+
+    def _ensure_norms(self):
+        if self._norms is None:
+            matrix = self._matrix[:self._size]
+            self._norms = np.einsum('ij,ij->i', matrix, matrix).astype(np.float32)
+
+    def _reserve(self, capacity):
+        self._ensure_norms()
+        if capacity <= self._matrix.shape[0]:
+            return
+        capacity = max(capacity, 2 * self._matrix.shape[0], 64)
+        matrix = np.empty((capacity, ENCODING_SIZE), dtype=np.float32)
+        norms = np.empty(capacity, dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        norms[:self._size] = self._norms[:self._size]
+        self._matrix = matrix
+        self._norms = norms
+
+    def add(self, encoding, name):
+        """Add a single encoding"""
+        self.add_many([encoding], [name])
+
+    def add_many(self, encodings, names):
+        """Add several encodings in one copy"""
+        rows = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        names = list(names)
+        if len(names) != len(rows):
+            raise ValueError("encodings and names must have the same length")
+        with self._lock:
+            start = self._size
+            self._reserve(start + len(rows))
+            self._matrix[start:start + len(rows)] = rows
+            self._norms[start:start + len(rows)] = np.einsum('ij,ij->i', rows, rows)
+            self.names.extend(names)
+            self._size = start + len(rows)
+            if self.index is not None and self.index.is_trained:
+                self.index.add(rows, start)
+            self._maybe_build_index()
+
+    def extend(self, encodings, names, start):
+        """Add rows loaded by another process, as returned by load_new_encodings().
+
+        encodings holds rows start onwards and names the rows past the
+        current size. With start 0 it is the whole (memory-mapped) store and
+        replaces the matrix without a copy; only the new rows' norms and
+        index entries are computed.
+        """
+        names = list(names)
+        if start != 0:
+            self.add_many(encodings[self._size - start:], names)
+            return
+        with self._lock:
+            old_size = self._size
+            rows = encodings[old_size:old_size + len(names)]
+            if self._norms is not None:
+                self._norms = np.concatenate([self._norms[:old_size], np.einsum('ij,ij->i', rows, rows)])
+            self._matrix = encodings
+            self.names.extend(names)
+            self._size = old_size + len(names)
+            if self.index is not None and self.index.is_trained:
+                self.index.add(rows, old_size)
+            self._maybe_build_index()
+
+    def retire(self, indices):
+        """Exclude rows from matching without removing them.
+
+        Their norms are set to infinity, so every distance to them is
+        infinite on both the exact and the IVF path.
+        """
+        indices = [int(i) for i in indices if i not in self._retired]
+        if not indices:
+            return
+        with self._lock:
+            self._ensure_norms()
+            self._norms[indices] = np.inf
+            self._retired.update(indices)
+            if self.index is not None and self.index.is_trained:
+                self.index.retire(indices)
+
+    @property
+    def active_size(self):
+        """Rows that can still be matched"""
+        return self._size - len(self._retired)
+
+    def attach_index(self, index, path=None):
+        """Match through an ANN index, loading a persisted copy from path"""
+        with self._lock:
+            self.index = index
+            self.index_path = path
+            if index is None:
+                return
+            if path and os.path.exists(path):
+                try:
+                    index.load(path)
+                except Exception as e:
+                    print(f"Could not load face index {path}: {e}")
+                    index.reset()
+            if index.is_trained:
+                if len(index) > self._size:
+                    # Index is ahead of the gallery, so it cannot be trusted
+                    index.reset()
+                else:
+                    index.add(self._matrix[len(index):self._size], len(index))
+            self._maybe_build_index()
+
+    def _maybe_build_index(self):
+        if self.index is None or self._size < self.exact_threshold:
+            return
+        factor = self.index.retrain_factor
+        if not self.index.is_trained or (factor and self._size > factor * self.index.trained_size):
+            self.index.build(self._matrix[:self._size])
+            if self._retired:
+                self.index.retire(sorted(self._retired))
+
+    def save_index(self):
+        """Persist the ANN index next to the encodings file"""
+        with self._lock:
+            if self.index is not None and self.index.is_trained and self.index_path:
+                self.index.save(self.index_path)
+
+    def _use_index(self):
+        return self.index is not None and self.index.is_trained and self._size >= self.exact_threshold
+
+    def distances(self, encodings):
+        """Euclidean distances from each query to every known face (N x size)"""
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            self._ensure_norms()
+            size = self._size
+            matrix = self._matrix[:size]
+            norms = self._norms[:size]
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        squared = query_norms[:, None] + norms[None, :] - 2.0 * (queries @ matrix.T)
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared)
+
+    def match(self, encodings, tolerance=None):
+        """Match a batch of encodings.
+
+        Returns (indices, distances) for the closest known face of each query.
+        The index is -1 when the gallery is empty or the best distance is not
+        below the tolerance.
+        """
+        if tolerance is None:
+            tolerance = self.tolerance
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        count = len(queries)
+        if count == 0 or self._size == 0:
+            return (np.full(count, -1, dtype=np.int64),
+                    np.full(count, np.inf, dtype=np.float32))
+
+        if self._use_index():
+            with self._lock:
+                self._ensure_norms()
+                indices, best = self.index.search(queries, self._matrix[:self._size], self._norms[:self._size])
+        else:
+            distances = self.distances(queries)
+            indices = np.argmin(distances, axis=1)
+            best = distances[np.arange(count), indices]
+        indices = np.where(best < tolerance, indices, -1)
+        return indices, best
+
+    def distance(self, row, encoding):
+        """Distance from one query to one stored row (inf for retired rows)"""
+        if row < 0 or row >= self._size or row in self._retired:
+            return np.inf
+        return float(np.linalg.norm(self._matrix[row] - np.asarray(encoding, dtype=np.float32)))
+
+    def match_names(self, encodings, tolerance=None):
+        """Like match() but returns names, with "Unknown" for misses"""
+        indices, _ = self.match(encodings, tolerance)
+        return [self.names[i] if i >= 0 else "Unknown" for i in indices]
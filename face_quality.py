@@ -0,0 +1,131 @@
+import math
+import threading
+
+import numpy as np
+
+from metrics import FACES_REJECTED
+
+# Laplacian variance of a sharp face crop, and face height in pixels, that
+# count as full quality for an enrollment sample
+SHARPNESS_REFERENCE = 100.0
+SIZE_REFERENCE = 120
+
+
+def to_gray(rgb):
+    """Luma of an RGB image or crop as float32"""
+    rgb = np.asarray(rgb, dtype=np.float32)
+    if rgb.ndim == 2:
+        return rgb
+    return rgb[..., 0] * 0.299 + rgb[..., 1] * 0.587 + rgb[..., 2] * 0.114
+
+
+def face_crop(image, location):
+    """Crop a (top, right, bottom, left) box, clipped to the image"""
+    top, right, bottom, left = location
+    height, width = image.shape[:2]
+    return image[max(0, top):min(height, bottom), max(0, left):min(width, right)]
+
+
+def sharpness(gray):
+    """Variance of the 4-neighbour Laplacian; low values mean a blurred face"""
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return 0.0
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4.0 * gray[1:-1, 1:-1])
+    return float(laplacian.var())
+
+
+def sample_quality(rgb, location):
+    """0..1 quality of an enrollment photo's face: sharpness times size, each capped at 1"""
+    gray = to_gray(face_crop(rgb, location))
+    size = min(1.0, gray.shape[0] / SIZE_REFERENCE)
+    return round(min(1.0, sharpness(gray) / SHARPNESS_REFERENCE) * size, 4)
+
+
+def pose_angles(shape):
+    """(yaw, roll) estimates from dlib's 5-point landmarks.
+
+    yaw is the nose's offset from the eye midpoint along the eye line, as a
+    fraction of the eye distance (0 frontal, about 0.5 in profile); roll is
+    the eye line's tilt in degrees.
+    """
+    points = np.array([(shape.part(i).x, shape.part(i).y) for i in range(5)], dtype=np.float64)
+    first_eye, second_eye, nose = points[0:2].mean(axis=0), points[2:4].mean(axis=0), points[4]
+    eye_line = second_eye - first_eye
+    eye_distance = float(np.dot(eye_line, eye_line))
+    if eye_distance == 0:
+        return 1.0, 90.0
+    yaw = abs(float(np.dot(nose - (first_eye + second_eye) / 2, eye_line)) / eye_distance)
+    roll = abs((math.degrees(math.atan2(eye_line[1], eye_line[0])) + 90) % 180 - 90)
+    return yaw, roll
+
+
+REJECT_REASONS = ('small', 'blurry', 'dark', 'bright', 'low_contrast', 'pose')
+
+
+class QualityGate:
+    """Cheap checks that keep faces not worth encoding away from the dlib encoder.
+
+    check() looks at the face crop (size, Laplacian variance, mean and
+    spread of brightness) and check_pose() at the 5-point landmarks the
+    encoder computes anyway, before the expensive descriptor. Sizes are in
+    pixels of the image being encoded (the downscaled frame when detection
+    is downscaled). Rejections are counted per reason, and per camera in
+    /metrics when camera_id is set; a threshold of None disables its check.
+    """
+
+    def __init__(self, min_face_size=24, min_sharpness=25.0, min_brightness=40, max_brightness=220,
+                 min_contrast=15.0, max_yaw=0.35, max_roll=30.0, camera_id=None):
+        self.min_face_size = min_face_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_contrast = min_contrast
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+        self.camera_id = camera_id
+        self.passed = 0
+        self.skipped = dict.fromkeys(REJECT_REASONS, 0)
+        self._lock = threading.Lock()
+
+    def _reject(self, reason):
+        with self._lock:
+            self.skipped[reason] += 1
+        if self.camera_id is not None:
+            FACES_REJECTED.inc(self.camera_id, reason)
+        return reason
+
+    def check(self, rgb, location):
+        """Reason to skip the face at location, or None"""
+        top, right, bottom, left = location
+        if self.min_face_size and min(bottom - top, right - left) < self.min_face_size:
+            return self._reject('small')
+        gray = to_gray(face_crop(rgb, location))
+        if not gray.size:
+            return self._reject('small')
+        brightness = float(gray.mean())
+        if self.min_brightness is not None and brightness < self.min_brightness:
+            return self._reject('dark')
+        if self.max_brightness is not None and brightness > self.max_brightness:
+            return self._reject('bright')
+        if self.min_contrast is not None and float(gray.std()) < self.min_contrast:
+            return self._reject('low_contrast')
+        if self.min_sharpness is not None and sharpness(gray) < self.min_sharpness:
+            return self._reject('blurry')
+        return None
+
+    def check_pose(self, shape):
+        """Reason to skip a face given its landmarks, or None (counts passes)"""
+        if self.max_yaw is not None or self.max_roll is not None:
+            yaw, roll = pose_angles(shape)
+            if (self.max_yaw is not None and yaw > self.max_yaw) or (self.max_roll is not None
+                                                                      and roll > self.max_roll):
+                return self._reject('pose')
+        with self._lock:
+            self.passed += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {'passed': self.passed, 'skipped': sum(self.skipped.values()),
+                    'skipped_by_reason': dict(self.skipped)}
@@ -0,0 +1,165 @@
+import numpy as np
+
+from face_gallery import ENCODING_SIZE
+
+MAX_EXEMPLARS = 4
+# Exemplars closer than this add little over the one already kept
+MIN_EXEMPLAR_SPREAD = 0.15
+
+
+class FaceTemplate:
+    """Compact per-student template: a centroid plus a few diverse exemplars.
+
+    The centroid is the quality-weighted mean of every sample folded in so
+    far and weight is their summed quality (stored as the centroid row's
+    quality). Exemplars are the best samples that are at least min_spread
+    apart, so different poses and lighting are kept without storing every
+    photo. update() needs only the template, not the earlier samples.
+    """
+
+    def __init__(self, max_exemplars=MAX_EXEMPLARS, min_spread=MIN_EXEMPLAR_SPREAD):
+        self.max_exemplars = max_exemplars
+        self.min_spread = min_spread
+        self.centroid = None
+        self.weight = 0.0
+        self.exemplars = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self.qualities = np.empty(0, dtype=np.float32)
+
+    @classmethod
+    def from_rows(cls, encodings, entries, **kwargs):
+        """Rebuild from a student's stored rows: a template, or legacy raw samples"""
+        template = cls(**kwargs)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        kinds = [entry.get('kind') for entry in entries]
+        if 'centroid' not in kinds:
+            template.update(encodings, [entry.get('quality') or 1.0 for entry in entries])
+            return template
+        rows = current_rows(entries)
+        centroid = rows[0]
+        template.centroid = encodings[centroid].copy()
+        template.weight = float(entries[centroid].get('quality') or 1.0)
+        exemplars = [row for row in rows[1:] if kinds[row] == 'exemplar']
+        template.exemplars = encodings[exemplars].copy()
+        template.qualities = np.array([entries[row].get('quality') or 1.0 for row in exemplars], dtype=np.float32)
+        return template
+
+    def update(self, encodings, qualities):
+        """Fold new samples in: running weighted mean, then re-pick exemplars"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        # A zero-quality photo still counts a little rather than vanishing
+        qualities = np.maximum(np.asarray(qualities, dtype=np.float32), 0.01)
+        if not len(encodings):
+            return
+        total = self.weight + float(qualities.sum())
+        weighted = (qualities[:, None] * encodings).sum(axis=0)
+        if self.centroid is not None:
+            weighted += self.weight * self.centroid
+        self.centroid = (weighted / total).astype(np.float32)
+        self.weight = total
+        self.exemplars, self.qualities = self._select(np.vstack([self.exemplars, encodings]),
+                                                      np.concatenate([self.qualities, qualities]))
+
+    def _select(self, candidates, qualities):
+        # Greedy: best quality first, then whichever scores best on
+        # quality x distance to the nearest exemplar already chosen
+        chosen = [int(np.argmax(qualities))]
+        nearest = np.linalg.norm(candidates - candidates[chosen[0]], axis=1)
+        while len(chosen) < self.max_exemplars:
+            scores = np.where(nearest >= self.min_spread, qualities * nearest, -1.0)
+            best = int(np.argmax(scores))
+            if scores[best] < 0:
+                break
+            chosen.append(best)
+            nearest = np.minimum(nearest, np.linalg.norm(candidates - candidates[best], axis=1))
+        return candidates[chosen], qualities[chosen]
+
+    def __len__(self):
+        return 0 if self.centroid is None else 1 + len(self.exemplars)
+
+    def rows(self):
+        """(encodings, kinds, qualities) to store, centroid first"""
+        encodings = np.vstack([self.centroid[None, :], self.exemplars])
+        kinds = ['centroid'] + ['exemplar'] * len(self.exemplars)
+        qualities = [round(self.weight, 4)] + [round(float(q), 4) for q in self.qualities]
+        return encodings, kinds, qualities
+
+
+def current_rows(entries):
+    """Positions of a student's current rows: from the last centroid on, or all legacy rows"""
+    starts = [i for i, entry in enumerate(entries) if entry.get('kind') == 'centroid']
+    return list(range(starts[-1] if starts else 0, len(entries)))
+
+
+def retired_rows(names, entries, start):
+    """Gallery rows replaced by the templates among entries.
+
+    entries describe gallery rows start onwards (names covers the whole
+    gallery); each template replaces every earlier row of its student.
+    """
+    replaced = {}
+    for offset, entry in enumerate(entries):
+        if entry.get('kind') == 'centroid':
+            replaced[entry['name']] = start + offset
+    if not replaced:
+        return []
+    return [row for row, name in enumerate(names[:start + len(entries)])
+            if name in replaced and row < replaced[name]]
+
+
+def student_label(students_data, labels_by_id, name, student_id):
+    """Key a student is stored and recognized under.
+
+    A known student_id keeps its label (re-enrollment); otherwise the name
+    is used, with the ID appended when another student already has it.
+    labels_by_id maps student_id -> label and is updated.
+    """
+    label = labels_by_id.get(student_id)
+    if label is None:
+        label = name if name not in students_data else f"{name} ({student_id})"
+        labels_by_id[student_id] = label
+    return label
+
+
+def labels_by_id(students_data):
+    return {record.get('student_id'): label for label, record in students_data.items()}
+
+
+def build_templates(storage, students_data, students, added_date):
+    """Create or update the templates of several students.
+
+    students is a list of (name, student_id, image_path, encodings,
+    qualities), one per student; students_data is updated in place.
+    Returns (encodings, labels, student_ids, kinds, qualities) rows to
+    append to storage.
+    """
+    known = labels_by_id(students_data)
+    # Labels first (each one taken as soon as it is given out), so the
+    # stored rows of every re-enrolled student can be read in one pass
+    taken = set(students_data)
+    student_labels = []
+    for name, student_id, *_ in students:
+        student_labels.append(student_label(taken, known, name, student_id))
+        taken.add(student_labels[-1])
+    stored = storage.load_student_encodings([label for label in student_labels if label in students_data])
+    encodings, labels, student_ids, kinds, qualities = [], [], [], [], []
+    for label, (name, student_id, image_path, samples, sample_qualities) in zip(student_labels, students):
+        record = students_data.get(label)
+        if record is None:
+            template = FaceTemplate()
+        else:
+            template = FaceTemplate.from_rows(*stored[label])
+        template.update(samples, sample_qualities)
+        students_data[label] = {
+            'student_id': student_id,
+            'image_path': image_path,
+            'added_date': record['added_date'] if record and record.get('added_date') else added_date,
+        }
+
+        rows, row_kinds, row_qualities = template.rows()
+        encodings.append(rows)
+        labels.extend([label] * len(rows))
+        student_ids.extend([student_id] * len(rows))
+        kinds.extend(row_kinds)
+        qualities.extend(row_qualities)
+    encodings = np.vstack(encodings) if encodings else np.empty((0, ENCODING_SIZE), dtype=np.float32)
+    return encodings, labels, student_ids, kinds, qualities
@@ -0,0 +1,115 @@
+import itertools
+
+import cv2
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    inter = (right - left) * (bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+def create_cv_tracker(kind):
+    """OpenCV single-object tracker ('KCF', 'CSRT', 'MIL'), or None if unavailable"""
+    for module in (cv2, getattr(cv2, 'legacy', None)):
+        factory = getattr(module, f'Tracker{kind}_create', None) if module is not None else None
+        if factory is not None:
+            return factory()
+    return None
+
+
+class Track:
+    """One face followed across frames"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, location, frame_index):
+        self.track_id = next(Track._ids)
+        self.location = location
+        self.name = "Unknown"
+        self.encoded_at = None
+        self.last_seen = frame_index
+        self.missed = 0
+        self.cv_tracker = None
+
+    def needs_encoding(self, frame_index, refresh_interval):
+        if self.encoded_at is None or self.name == "Unknown":
+            return True
+        return frame_index - self.encoded_at >= refresh_interval
+
+
+class FaceTracker:
+    """Associates detections with existing tracks by IoU.
+
+    Identities are carried forward, so only new tracks and tracks due for a
+    refresh have to go through the face encoder. When an OpenCV tracker
+    type is given, boxes are also moved on frames without detection.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=3, cv_tracker=None):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.cv_tracker = cv_tracker
+        self.tracks = []
+
+    def reset(self):
+        self.tracks = []
+
+    def update(self, locations, frame_index, frame=None):
+        """Match detected locations to tracks; returns one track per location"""
+        pairs = sorted(((iou(track.location, location), t, d)
+                        for t, track in enumerate(self.tracks)
+                        for d, location in enumerate(locations)), reverse=True)
+        assigned = [None] * len(locations)
+        used = set()
+        for overlap, t, d in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t in used or assigned[d] is not None:
+                continue
+            used.add(t)
+            assigned[d] = self.tracks[t]
+
+        for t, track in enumerate(self.tracks):
+            if t not in used:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for d, location in enumerate(locations):
+            track = assigned[d]
+            if track is None:
+                track = Track(location, frame_index)
+                self.tracks.append(track)
+            track.location = location
+            track.last_seen = frame_index
+            track.missed = 0
+            if self.cv_tracker and frame is not None:
+                self._init_cv_tracker(track, frame)
+            assigned[d] = track
+        return assigned
+
+    def _init_cv_tracker(self, track, frame):
+        track.cv_tracker = create_cv_tracker(self.cv_tracker)
+        if track.cv_tracker is None:
+            return
+        top, right, bottom, left = track.location
+        track.cv_tracker.init(frame, (left, top, right - left, bottom - top))
+
+    def follow(self, frame):
+        """Move track boxes on a frame without detection"""
+        for track in self.tracks:
+            if track.cv_tracker is None:
+                continue
+            ok, (x, y, w, h) = track.cv_tracker.update(frame)
+            if ok:
+                track.location = (int(y), int(x + w), int(y + h), int(x))
+
+    def faces(self):
+        """Current (location, name) pairs of tracks seen in the last detection"""
+        return [(track.location, track.name) for track in self.tracks if track.missed == 0]
@@ -0,0 +1,32 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no flock, so only one process may write the data files
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Hold an flock on path (created if needed) for the duration of the block.
+
+    flock locks belong to the open file, so they exclude other threads of
+    this process as well as other processes (e.g. gunicorn workers).
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def temp_path(path):
+    """Temp file next to path, unique per process and thread, for write + os.replace"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
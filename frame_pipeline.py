@@ -0,0 +1,344 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from metrics import FRAMES, STAGE_SECONDS
+
+
+def annotate_frame(frame, faces):
+    """Draw (location, name) boxes on a BGR frame in place"""
+    for (top, right, bottom, left), name in faces:
+        color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
+        cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+        cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
+
+        font = cv2.FONT_HERSHEY_DUPLEX
+        cv2.putText(frame, name, (left + 6, bottom - 6), font, 0.6, (255, 255, 255), 1)
+    return frame
+
+
+class LatestSlot:
+    """Bounded single-item queue: put() replaces the previous item.
+
+    Readers pass the last sequence number they saw and block until something
+    newer arrives, so a slow stage never works through a backlog.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._seq = 0
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            self._item = item
+            self._seq += 1
+            self._cond.notify_all()
+
+    def get(self, last_seq=0, timeout=None):
+        """Return (seq, item) newer than last_seq, or (last_seq, None) on timeout/close"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq or self._closed, timeout):
+                return last_seq, None
+            if self._seq <= last_seq:
+                return last_seq, None
+            return self._seq, self._item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class Subscriber:
+    """Per-viewer bounded buffer; the oldest part is dropped when full"""
+
+    def __init__(self, size):
+        self.buffer = deque(maxlen=size)
+        self.dropped = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def push(self, item):
+        with self.cond:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append(item)
+            self.cond.notify()
+
+    def pop(self, timeout=None):
+        """Next item, or None on timeout/close"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.buffer or self.closed, timeout):
+                return None
+            return self.buffer.popleft() if self.buffer else None
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+
+class FrameBroadcaster:
+    """Fans one producer's output out to any number of viewers.
+
+    publish() never waits on a viewer: each subscriber has its own small
+    buffer, so a slow client only loses its own frames.
+    """
+
+    def __init__(self, buffer_size=2):
+        self.buffer_size = buffer_size
+        self.dropped = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscriber = Subscriber(self.buffer_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.discard(subscriber)
+                self.dropped += subscriber.dropped
+        subscriber.close()
+
+    def publish(self, item):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(item)
+
+    def dropped_total(self):
+        """Parts dropped for slow viewers, past and present"""
+        with self._lock:
+            return self.dropped + sum(subscriber.dropped for subscriber in self._subscribers)
+
+    def close(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+
+
+class RateMeter:
+    """Events per second over a sliding window"""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.count = 0
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def tick(self):
+        now = time.monotonic()
+        with self._lock:
+            self.count += 1
+            self._times.append(now)
+            while self._times and now - self._times[0] > self.window:
+                self._times.popleft()
+
+    def rate(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._times and now - self._times[0] > self.window:
+                self._times.popleft()
+            return len(self._times) / self.window
+
+
+class FramePipeline:
+    """Capture -> recognition workers -> annotate/JPEG stages on threads.
+
+    The capture thread only ever keeps the newest frame. A scheduler submits
+    the newest frame to a recognition worker pool at recognition_fps, with
+    at most max_in_flight passes outstanding, and publishes the latest
+    results; the encoder draws those results onto the newest frame and
+    JPEG-encodes it at stream_fps. A slow recognition pass therefore never
+    stalls video. Pass a shared executor to serve several cameras from one
+    worker pool.
+
+    Each output frame is annotated and encoded once and broadcast to every
+    viewer of stream(); with no viewers the encoder skips the work. Stage
+    timings and frame counts go to the metrics registry under camera_id.
+    If the camera stops delivering frames the pipeline stops itself and
+    calls on_stop(), so the owner can release the camera.
+    """
+
+    def __init__(self, camera, recognize, active=None, stream_fps=15, recognition_fps=5, workers=2,
+                 executor=None, max_in_flight=None, camera_id='default', on_stop=None):
+        self.camera = camera
+        self.camera_id = camera_id
+        self.recognize = recognize
+        self.active = active or (lambda: True)
+        self.on_stop = on_stop
+        self.stream_fps = stream_fps
+        self.recognition_fps = recognition_fps
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognition')
+        self.max_in_flight = max_in_flight or workers
+
+        self.frames_slot = LatestSlot()
+        self.broadcaster = FrameBroadcaster()
+        self.capture_rate = RateMeter()
+        self.recognition_rate = RateMeter()
+        self.stream_rate = RateMeter()
+
+        self._faces = []
+        self._faces_seq = 0
+        self._faces_lock = threading.Lock()
+        self._in_flight = 0
+        self._threads = []
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self._threads = [threading.Thread(target=self._capture_loop, daemon=True),
+                         threading.Thread(target=self._schedule_loop, daemon=True),
+                         threading.Thread(target=self._encode_loop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        self.frames_slot.close()
+        self.broadcaster.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2.0)
+        self._threads = []
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+
+    def _capture_loop(self):
+        while self.running:
+            started = time.perf_counter()
+            ret, frame = self.camera.read()
+            STAGE_SECONDS.observe(time.perf_counter() - started, self.camera_id, 'capture')
+            if not ret:
+                # Not running: stop() was called and the read was interrupted
+                if self.running:
+                    print("Failed to grab frame from camera")
+                    if self.on_stop is not None:
+                        self.on_stop()
+                    else:
+                        self.stop()
+                break
+            self.capture_rate.tick()
+            FRAMES.inc(self.camera_id, 'captured')
+            self.frames_slot.put(frame)
+
+    def _schedule_loop(self):
+        last_seq = 0
+        interval = 1.0 / self.recognition_fps
+        while self.running:
+            started = time.monotonic()
+            if not self.active():
+                with self._faces_lock:
+                    self._faces = []
+                time.sleep(0.1)
+                continue
+
+            with self._faces_lock:
+                busy = self._in_flight >= self.max_in_flight
+            if not busy:
+                seq, frame = self.frames_slot.get(last_seq, timeout=1.0)
+                if frame is None:
+                    continue
+                last_seq = seq
+                with self._faces_lock:
+                    self._in_flight += 1
+                self.executor.submit(self._recognize, seq, frame)
+
+            elapsed = time.monotonic() - started
+            if elapsed < interval:
+                time.sleep(interval - elapsed)
+
+    def _recognize(self, seq, frame):
+        started = time.perf_counter()
+        try:
+            faces = self.recognize(frame)
+        except Exception as e:
+            print(f"Error processing frame: {e}")
+            faces = None
+        STAGE_SECONDS.observe(time.perf_counter() - started, self.camera_id, 'recognize')
+        with self._faces_lock:
+            self._in_flight -= 1
+            if faces is None:
+                return
+            self.recognition_rate.tick()
+            FRAMES.inc(self.camera_id, 'recognized')
+            # Workers can finish out of order; keep the newest result
+            if seq > self._faces_seq:
+                self._faces = faces
+                self._faces_seq = seq
+
+    def _encode_loop(self):
+        last_seq = 0
+        interval = 1.0 / self.stream_fps
+        while self.running:
+            started = time.monotonic()
+            seq, frame = self.frames_slot.get(last_seq, timeout=1.0)
+            if frame is None:
+                continue
+            if seq - last_seq > 1:
+                # Captured frames the stream never showed
+                FRAMES.inc(self.camera_id, 'dropped', amount=seq - last_seq - 1)
+            last_seq = seq
+            if len(self.broadcaster):
+                self._encode(frame)
+            elapsed = time.monotonic() - started
+            if elapsed < interval:
+                time.sleep(interval - elapsed)
+
+    def _encode(self, frame):
+        with self._faces_lock:
+            faces = self._faces
+        started = time.perf_counter()
+        frame = annotate_frame(frame.copy(), faces)
+        encode_started = time.perf_counter()
+        ret, buffer = cv2.imencode('.jpg', frame)
+        STAGE_SECONDS.observe(encode_started - started, self.camera_id, 'annotate')
+        STAGE_SECONDS.observe(time.perf_counter() - encode_started, self.camera_id, 'jpeg')
+        if ret:
+            # Build the multipart part once; every viewer gets the same bytes
+            self.broadcaster.publish(b'--frame\r\n'
+                                     b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+            self.stream_rate.tick()
+            FRAMES.inc(self.camera_id, 'streamed')
+
+    def stream(self):
+        """Yield multipart MJPEG parts for one viewer until it disconnects"""
+        subscriber = self.broadcaster.subscribe()
+        try:
+            while self.running:
+                part = subscriber.pop(timeout=1.0)
+                if part is not None:
+                    yield part
+        finally:
+            self.broadcaster.unsubscribe(subscriber)
+
+    def stats(self):
+        captured = self.capture_rate.count
+        streamed = self.stream_rate.count
+        return {
+            'capture_fps': round(self.capture_rate.rate(), 1),
+            'stream_fps': round(self.stream_rate.rate(), 1),
+            'recognition_fps': round(self.recognition_rate.rate(), 1),
+            'target_stream_fps': self.stream_fps,
+            'target_recognition_fps': self.recognition_fps,
+            'frames_captured': captured,
+            'frames_streamed': streamed,
+            'frames_recognized': self.recognition_rate.count,
+            'frames_dropped': max(0, captured - streamed),
+            'viewers': len(self.broadcaster),
+            'viewer_frames_dropped': self.broadcaster.dropped_total(),
+        }
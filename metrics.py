@@ -0,0 +1,157 @@
+import bisect
+import threading
+
+# Seconds; covers a fast JPEG encode up to a slow CNN detection
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """Monotonic counter with fixed label names, values passed positionally"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        return [f"{self.name}{_labels(self.labels, values)} {value}" for values, value in self.samples()]
+
+
+class Histogram:
+    """Prometheus-style histogram with fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), sum
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][slot] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            return sorted((values, (list(counts), total)) for values, (counts, total) in self._series.items())
+
+    def _quantile(self, counts, quantile):
+        rank = quantile * sum(counts)
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return 0.0
+
+    def summary(self, *label_values):
+        """count, mean and estimated p50/p95 in milliseconds for one series"""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                return {'count': 0}
+            counts, total = list(series[0]), series[1]
+        count = sum(counts)
+        return {
+            'count': count,
+            'mean_ms': round(1000 * total / count, 2),
+            'p50_ms': round(1000 * self._quantile(counts, 0.5), 2),
+            'p95_ms': round(1000 * self._quantile(counts, 0.95), 2),
+        }
+
+    def render(self):
+        lines = []
+        for values, (counts, total) in self.samples():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collects metrics and renders the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(name, documentation, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram('attendance_stage_seconds', "Time spent per live pipeline stage",
+                                   ('camera', 'stage'))
+FACES = REGISTRY.counter('attendance_faces_total', "Faces detected, encoded, matched and unknown",
+                         ('camera', 'outcome'))
+FACES_REJECTED = REGISTRY.counter('attendance_faces_rejected_total',
+                                  "Faces skipped by the quality gate before encoding", ('camera', 'reason'))
+FRAMES = REGISTRY.counter('attendance_frames_total', "Frames captured, recognized, streamed and dropped",
+                          ('camera', 'outcome'))
+
+STAGES = ('capture', 'resize', 'detect', 'track', 'encode', 'match', 'mark', 'recognize', 'annotate', 'jpeg')
+FACE_OUTCOMES = ('detected', 'encoded', 'matched', 'unknown')
+FRAME_OUTCOMES = ('captured', 'recognized', 'streamed', 'dropped')
+
+
+def camera_metrics(camera_id):
+    """Per-stage latency summaries and counters for one camera"""
+    stages = {stage: STAGE_SECONDS.summary(camera_id, stage) for stage in STAGES}
+    return {
+        'stages': {stage: summary for stage, summary in stages.items() if summary['count']},
+        'faces': {outcome: FACES.value(camera_id, outcome) for outcome in FACE_OUTCOMES},
+        'faces_rejected': {reason: value for (camera, reason), value in FACES_REJECTED.samples()
+                           if camera == camera_id},
+        'frames': {outcome: FRAMES.value(camera_id, outcome) for outcome in FRAME_OUTCOMES},
+    }
@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from face_detector import create_detector
+from face_encoder import encode_frames
+from face_quality import QualityGate
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def _sampled_frames(source, stride, fps=None, start=None):
+    """Return (frame_refs, timestamps, seekable) for every stride-th frame of the source.
+
+    frame_refs are frame numbers for a video and file paths for a frame
+    directory. Timestamps are datetimes in recording time. seekable is
+    False for a video that does not report its frame count (some streamed
+    or damaged containers): its frames were counted by reading it through,
+    and it should be read sequentially rather than seeked into.
+    """
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(source, name) for name in os.listdir(source)
+                       if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)[::stride]
+        if start is not None:
+            fps = fps or 1.0
+            return paths, [start + timedelta(seconds=i * stride / fps) for i in range(len(paths))], True
+        return paths, [datetime.fromtimestamp(os.path.getmtime(path)) for path in paths], True
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video {source}")
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    seekable = frame_count > 0
+    if not seekable:
+        frame_count = 0
+        while capture.grab():
+            frame_count += 1
+    fps = fps or capture.get(cv2.CAP_PROP_FPS) or 25.0
+    capture.release()
+    if start is None:
+        # The file was last written when the recording ended
+        start = datetime.fromtimestamp(os.path.getmtime(source)) - timedelta(seconds=frame_count / fps)
+    numbers = list(range(0, frame_count, stride))
+    return numbers, [start + timedelta(seconds=n / fps) for n in numbers], seekable
+
+
+def _read_frames(source, refs):
+    """Yield (position, frame) for the referenced frames of one segment"""
+    if os.path.isdir(source):
+        for position, path in enumerate(refs):
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield position, frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    wanted = set(refs)
+    number = refs[0]
+    if number:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, number)
+    position = 0
+    while number <= refs[-1]:
+        if number in wanted:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            yield position, frame
+            position += 1
+        elif not capture.grab():
+            break
+        number += 1
+    capture.release()
+
+
+def process_segment(task):
+    """Worker: detect and encode faces in one segment of the recording.
+
+    Returns ([(position, [encodings])], quality gate stats or None) with
+    positions relative to the segment.
+    """
+    source, refs, detector_backend, scale, batch_size, quality = task
+    detector = create_detector(detector_backend, scale=scale)
+    gate = QualityGate(**quality) if quality is not None else None
+    results = []
+    batch = []
+
+    def flush():
+        encoded = encode_frames([(rgb, locations) for _, rgb, locations in batch], gate=gate)
+        for (position, _, _), encodings in zip(batch, encoded):
+            results.append((position, [encoding for encoding in encodings if encoding is not None]))
+        batch.clear()
+
+    for position, frame in _read_frames(source, refs):
+        detections = detector.detect(frame)
+        if detections.small_locations:
+            batch.append((position, detections.rgb, detections.small_locations))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return results, gate.stats() if gate is not None else None
+
+
+def process_recording(source, gallery, mark, stride=15, workers=None, start=None, fps=None,
+                      detector_backend='hog', scale=0.25, batch_size=8, quality=None):
+    """Mark attendance from a video file or frame directory, headless.
+
+    Sampled frames are split into contiguous segments decoded and encoded
+    across a process pool (one sequential segment for a video that cannot
+    be seeked); matching runs here against the gallery. mark is called as
+    mark(name, when) with the recording time at which each student was
+    first seen on each day the recording covers. quality is a dict of
+    QualityGate thresholds (None disables the gate). Returns
+    {(date, name): first_seen}.
+    """
+    refs, timestamps, seekable = _sampled_frames(source, stride, fps, start)
+    if not refs:
+        return {}
+    workers = workers or os.cpu_count() or 1
+    segment = max(1, -(-len(refs) // (workers * 4))) if seekable else len(refs)
+    tasks = [(source, refs[i:i + segment], detector_backend, scale, batch_size, quality)
+             for i in range(0, len(refs), segment)]
+
+    first_seen = {}
+    skipped = {}
+    # Spawned, not forked, so no worker inherits a lock held by another thread
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for offset, (results, stats) in zip(range(0, len(refs), segment), pool.map(process_segment, tasks)):
+            for reason, count in (stats or {}).get('skipped_by_reason', {}).items():
+                skipped[reason] = skipped.get(reason, 0) + count
+            for position, encodings in results:
+                if not encodings:
+                    continue
+                when = timestamps[offset + position]
+                for name in gallery.match_names(np.asarray(encodings)):
+                    # A recording past midnight marks each day it covers
+                    key = (when.date(), name)
+                    if name != "Unknown" and (key not in first_seen or when < first_seen[key]):
+                        first_seen[key] = when
+
+    if quality is not None:
+        details = ", ".join(f"{reason} {count}" for reason, count in skipped.items() if count)
+        print(f"Quality gate skipped {sum(skipped.values())} faces before encoding"
+              + (f" ({details})" if details else ""))
+    for (_, name), when in sorted(first_seen.items(), key=lambda item: item[1]):
+        mark(name, when)
+    return first_seen
@@ -0,0 +1,153 @@
+import threading
+import time
+from datetime import date
+
+import cv2
+import numpy as np
+
+from face_detector import create_detector
+from face_encoder import encode_faces
+from face_tracker import FaceTracker
+from metrics import FACES, STAGE_SECONDS
+from recognition_cache import RecognitionCache
+
+
+def recognize_image(data, detector=None):
+    """Decode and encode the faces of one uploaded image, statelessly.
+
+    data is JPEG/PNG bytes. With a detector, faces are detected first;
+    without one the whole image is taken as a single face crop. Returns
+    [(location, encoding)] in image coordinates, or None if the image
+    cannot be decoded.
+    """
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
+    if image is None:
+        return None
+    if detector is None:
+        height, width = image.shape[:2]
+        rgb, small_locations, locations = cv2.cvtColor(image, cv2.COLOR_BGR2RGB), [(0, width, height, 0)], None
+    else:
+        rgb, small_locations, locations = detector.detect(image)[:3]
+    encodings = encode_faces(rgb, small_locations)
+    return [(location, encoding) for location, encoding in zip(locations or small_locations, encodings)
+            if encoding is not None]
+
+
+class FrameRecognizer:
+    """Per-source recognition: detect, track, encode new faces, match.
+
+    Detection runs every detect_interval frames. Detected faces are tracked,
+    and the dlib encoder only runs for new tracks, unknown faces and tracks
+    older than refresh_interval frames; everyone else keeps their identity.
+    Encodings close to a recently matched one take their name from the
+    RecognitionCache instead of the gallery, and on_match is called once
+    per name per day. An optional QualityGate skips blurred, badly lit,
+    tiny or turned-away faces before encoding; they are retried at the
+    next detection.
+    """
+
+    def __init__(self, gallery, on_match=None, detector=None, detect_interval=2,
+                 refresh_interval=30, cv_tracker=None, cache=None, camera_id='default', quality_gate=None):
+        self.gallery = gallery
+        self.camera_id = camera_id
+        self.on_match = on_match
+        self.detector = detector or create_detector('hog')
+        self.detect_interval = detect_interval
+        self.refresh_interval = refresh_interval
+        self.tracker = FaceTracker(cv_tracker=cv_tracker)
+        self.cache = cache if cache is not None else RecognitionCache()
+        self.quality_gate = quality_gate
+        self.frame_index = 0
+        self.marks_skipped = 0
+        self._marked = (None, set())
+        self._lock = threading.Lock()
+
+    def process(self, frame):
+        """Return [(location, name)] in full-frame coordinates for a BGR frame"""
+        with self._lock:
+            frame_index = self.frame_index
+            self.frame_index += 1
+            if frame_index % self.detect_interval:
+                started = time.perf_counter()
+                self.tracker.follow(frame)
+                STAGE_SECONDS.observe(time.perf_counter() - started, self.camera_id, 'track')
+                return self.tracker.faces()
+
+        started = time.perf_counter()
+        detections = self.detector.detect(frame)
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(detections.resize_seconds, self.camera_id, 'resize')
+        STAGE_SECONDS.observe(elapsed - detections.resize_seconds, self.camera_id, 'detect')
+        FACES.inc(self.camera_id, 'detected', amount=len(detections.locations))
+
+        with self._lock:
+            started = time.perf_counter()
+            tracks = self.tracker.update(detections.locations, frame_index, frame)
+            STAGE_SECONDS.observe(time.perf_counter() - started, self.camera_id, 'track')
+            pending = [(track, small_location) for track, small_location in zip(tracks, detections.small_locations)
+                       if track.needs_encoding(frame_index, self.refresh_interval)]
+
+        if pending:
+            started = time.perf_counter()
+            encodings = encode_faces(detections.rgb, [small_location for _, small_location in pending],
+                                     gate=self.quality_gate)
+            STAGE_SECONDS.observe(time.perf_counter() - started, self.camera_id, 'encode')
+
+            encoded = [(track, encoding) for (track, _), encoding in zip(pending, encodings)
+                       if encoding is not None]
+            FACES.inc(self.camera_id, 'encoded', amount=len(encoded))
+            if encoded:
+                started = time.perf_counter()
+                names = self.match([encoding for _, encoding in encoded],
+                                   [track.location for track, _ in encoded])
+                STAGE_SECONDS.observe(time.perf_counter() - started, self.camera_id, 'match')
+                for (track, _), name in zip(encoded, names):
+                    track.name = name
+                    track.encoded_at = frame_index
+                    FACES.inc(self.camera_id, 'unknown' if name == "Unknown" else 'matched')
+                    if name != "Unknown" and self.on_match:
+                        self._notify(name)
+
+        with self._lock:
+            return [(track.location, track.name) for track in tracks]
+
+    def match(self, encodings, regions=None):
+        """Names for encodings, searching the gallery only on cache misses.
+
+        A cache hit is re-checked against its gallery row with the gallery
+        tolerance; regions are the faces' boxes, for the cache's region check.
+        """
+        gallery = self.gallery
+        regions = regions or [None] * len(encodings)
+
+        def verify(row, encoding):
+            return gallery.distance(row, encoding) < gallery.tolerance
+
+        rows = [self.cache.get(encoding, region, verify) for encoding, region in zip(encodings, regions)]
+        misses = [i for i, row in enumerate(rows) if row is None]
+        if misses:
+            indices, _ = gallery.match([encodings[i] for i in misses])
+            for i, row in zip(misses, indices):
+                rows[i] = int(row)
+                self.cache.put(encodings[i], rows[i], regions[i])
+        return [gallery.names[row] if row >= 0 else "Unknown" for row in rows]
+
+    def _notify(self, name):
+        # Once a name has been handed to on_match today, later sightings are free
+        today = date.today()
+        with self._lock:
+            if self._marked[0] != today:
+                self._marked = (today, set())
+            if name in self._marked[1]:
+                self.marks_skipped += 1
+                return
+            self._marked[1].add(name)
+        started = time.perf_counter()
+        self.on_match(name)
+        STAGE_SECONDS.observe(time.perf_counter() - started, self.camera_id, 'mark')
+
+    def stats(self):
+        stats = dict(self.cache.stats(), marks_skipped=self.marks_skipped)
+        if self.quality_gate is not None:
+            stats['quality'] = self.quality_gate.stats()
+        return stats
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import numpy as np
+
+from face_gallery import ENCODING_SIZE
+
+
+class RecognitionCache:
+    """Short-lived, size-bounded cache of recent gallery matches.
+
+    An entry remembers which gallery row a face matched and where in the
+    frame it was. A later encoding within threshold of the cached one, in
+    an overlapping region (IoU at least region_overlap, when both regions
+    are known), is a candidate hit; the caller's verify(row, encoding)
+    then re-checks it against that gallery row with the real tolerance, so
+    a cached result never labels a face the gallery would not match. Only
+    matches are cached, never "Unknown". Entries expire ttl seconds after
+    they were stored; when full, the least recently used one is replaced.
+    """
+
+    def __init__(self, max_size=256, ttl=10.0, threshold=0.3, region_overlap=0.3):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.region_overlap = region_overlap
+        self.hits = 0
+        self.misses = 0
+        self._encodings = np.zeros((max_size, ENCODING_SIZE), dtype=np.float32)
+        self._rows = np.full(max_size, -1, dtype=np.int64)
+        # (top, right, bottom, left); NaN when the entry has no region
+        self._regions = np.full((max_size, 4), np.nan)
+        self._expires = np.zeros(max_size)
+        self._last_used = np.zeros(max_size)
+        self._lock = threading.Lock()
+
+    def _overlaps(self, region):
+        if region is None:
+            return np.ones(self.max_size, dtype=bool)
+        top, right, bottom, left = region
+        regions = self._regions
+        width = np.minimum(regions[:, 1], right) - np.maximum(regions[:, 3], left)
+        height = np.minimum(regions[:, 2], bottom) - np.maximum(regions[:, 0], top)
+        inter = np.clip(width, 0, None) * np.clip(height, 0, None)
+        areas = (regions[:, 1] - regions[:, 3]) * (regions[:, 2] - regions[:, 0])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            overlap = inter / (areas + (right - left) * (bottom - top) - inter)
+        # Entries stored without a region match anywhere
+        return np.isnan(overlap) | (overlap >= self.region_overlap)
+
+    def get(self, encoding, region=None, verify=None):
+        """Gallery row of a cached match for this face, or None"""
+        now = time.monotonic()
+        encoding = np.asarray(encoding, dtype=np.float32)
+        with self._lock:
+            live = (self._expires > now) & self._overlaps(region)
+            if live.any():
+                distances = np.linalg.norm(self._encodings - encoding, axis=1)
+                distances[~live] = np.inf
+                slot = int(np.argmin(distances))
+                row = int(self._rows[slot])
+                if distances[slot] <= self.threshold and (verify is None or verify(row, encoding)):
+                    self._last_used[slot] = now
+                    self.hits += 1
+                    return row
+            self.misses += 1
+            return None
+
+    def put(self, encoding, row, region=None):
+        """Remember that encoding matched gallery row (row must be a match)"""
+        if row is None or row < 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            # Empty and expired slots first, then the least recently used
+            slot = int(np.argmin(np.where(self._expires > now, self._last_used, -np.inf)))
+            self._encodings[slot] = encoding
+            self._rows[slot] = row
+            self._regions[slot] = region if region is not None else np.nan
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = now
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self._expires > time.monotonic()))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'size': len(self),
+        }
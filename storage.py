@@ -0,0 +1,500 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from attendance_index import AttendanceIndex
+from encoding_store import EncodingStore
+from face_gallery import ENCODING_SIZE
+from file_lock import file_lock, temp_path
+
+ATTENDANCE_COLUMNS = ['Name', 'Student_ID', 'Date', 'Time', 'Status']
+
+
+def repair_tail(path):
+    """Fix the last row of the attendance CSV after a crash mid-write.
+
+    A last line that parses as a complete row only lost its line break,
+    which is put back; anything else is a partial row and is dropped. The
+    header line is never removed.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    if not size:
+        return
+    with open(path, 'rb+') as f:
+        header = f.readline()
+        if not header.endswith(b'\n'):
+            # Nothing but the header, cut short or without its line break
+            f.seek(0)
+            f.truncate()
+            f.write(','.join(ATTENDANCE_COLUMNS).encode() + b'\r\n')
+            return
+        f.seek(max(len(header), size - 65536))
+        tail = f.read()
+        if not tail or tail.endswith(b'\n'):
+            return
+        start = size - len(tail) + tail.rfind(b'\n') + 1
+        fields = next(csv.reader([tail[start - size:].decode('utf-8', 'replace')]), [])
+        if len(fields) == len(ATTENDANCE_COLUMNS) and all(fields):
+            print(f"Completing last attendance row of {path}")
+            f.write(b'\n' if tail.endswith(b'\r') else b'\r\n')
+        else:
+            print(f"Dropping incomplete attendance row at end of {path}")
+            f.truncate(start)
+
+
+def _matches(record, start_date=None, end_date=None, student=None, status=None):
+    date = record.get('Date') or ''
+    if start_date and date < start_date:
+        return False
+    if end_date and date > end_date:
+        return False
+    if student and student not in (record.get('Name'), record.get('Student_ID')):
+        return False
+    return not status or record.get('Status') == status
+
+
+def attendance_page(storage, limit=100, cursor=None, **filters):
+    """Return (records, next_cursor); next_cursor is None on the last page"""
+    records = []
+    next_cursor = None
+    for row_cursor, record in storage.iter_attendance(after=cursor, limit=limit + 1, **filters):
+        if len(records) == limit:
+            break
+        records.append(record)
+        next_cursor = row_cursor
+    else:
+        next_cursor = None
+    return records, next_cursor
+
+
+def valid_cursor(storage, cursor):
+    """Whether cursor is one storage.iter_attendance() could have handed out"""
+    try:
+        next(storage.iter_attendance(after=cursor, limit=0), None)
+    except ValueError:
+        return False
+    return True
+
+
+class FileStorage:
+    """Students in JSON, encodings in an EncodingStore, attendance in CSV"""
+
+    def __init__(self, students_db="students_database.json", attendance_file="attendance_records.csv",
+                 encodings_base="face_encodings", encodings_pickle="face_encodings.pkl"):
+        self.students_db = students_db
+        self.attendance_file = attendance_file
+        self.encodings_pickle = encodings_pickle
+        self.encoding_store = EncodingStore(encodings_base)
+        # Appends and the startup repair hold an exclusive flock, so a worker
+        # starting up never truncates a row another worker is writing
+        self.attendance_lock_file = attendance_file + ".lock"
+        with file_lock(self.attendance_lock_file):
+            if not os.path.exists(attendance_file):
+                with open(attendance_file, 'w', newline='') as f:
+                    csv.writer(f).writerow(ATTENDANCE_COLUMNS)
+            repair_tail(attendance_file)
+        self._attendance_index = None
+        self._index_lock = threading.Lock()
+        # (mtime, size) of the students file when load_students() last read it
+        self._students_stamp = None
+
+    @property
+    def attendance_index(self):
+        """Dedup index, built from the CSV on the first check"""
+        if self._attendance_index is None:
+            with self._index_lock:
+                if self._attendance_index is None:
+                    self._attendance_index = AttendanceIndex(self.attendance_file)
+        return self._attendance_index
+
+    def _students_file_stamp(self):
+        try:
+            stat = os.stat(self.students_db)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load_students(self):
+        self._students_stamp = self._students_file_stamp()
+        try:
+            with open(self.students_db, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def students_changed(self):
+        """Whether the students file was rewritten since load_students()"""
+        return self._students_file_stamp() != self._students_stamp
+
+    def save_students(self, students_data, names=None):
+        """Persist students; the JSON file is always rewritten whole.
+
+        With names, those students are merged into the file as it is now,
+        so students saved meanwhile by another worker are kept.
+        """
+        with file_lock(self.students_db + ".lock"):
+            if names is not None:
+                students_data = dict(self.load_students(), **{name: students_data[name] for name in names})
+            temp_file = temp_path(self.students_db)
+            with open(temp_file, 'w') as f:
+                json.dump(students_data, f, indent=2)
+            os.replace(temp_file, self.students_db)
+
+    def load_encodings(self, students_data=None):
+        """Return (encodings, entries), migrating the legacy pickle if needed"""
+        if not self.encoding_store.exists() and os.path.exists(self.encodings_pickle):
+            self.encoding_store.migrate_from_pickle(self.encodings_pickle, students_data)
+        return self.encoding_store.load()
+
+    def append_encodings(self, encodings, names, student_ids=None, kinds=None, qualities=None):
+        self.encoding_store.append(encodings, names, student_ids, kinds, qualities)
+
+    def load_student_encodings(self, names):
+        return self.encoding_store.rows_for(names)
+
+    def encodings_changed(self):
+        return self.encoding_store.changed()
+
+    def load_new_encodings(self):
+        """Return (encodings, entries, start) for rows added since the last load.
+
+        encodings is a fresh read-only map of the whole store (start is 0),
+        so galleries in every worker share one copy of it.
+        """
+        encodings, entries = self.encoding_store.load_new()
+        return encodings, entries, 0
+
+    def append_attendance(self, rows, sync=True):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        with file_lock(self.attendance_lock_file), open(self.attendance_file, 'a', newline='') as f:
+            f.write(buffer.getvalue())
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+
+    def is_marked(self, name, date):
+        return self.attendance_index.contains(name, date)
+
+    def add_marked(self, name, date):
+        self.attendance_index.add(name, date)
+
+    def attendance_changed(self, after=None):
+        """True when rows may have been appended (by any process) past cursor after"""
+        try:
+            return not after or os.path.getsize(self.attendance_file) > int(after)
+        except OSError:
+            return False
+
+    def iter_attendance(self, start_date=None, end_date=None, student=None, status=None, after=None,
+                        limit=None):
+        """Lazily yield (cursor, record) in file order.
+
+        The cursor is the byte offset just past the row, so resuming a page
+        seeks straight to it instead of re-reading earlier history. Raises
+        ValueError for an offset that is not the start of a row.
+        """
+        try:
+            f = open(self.attendance_file, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            header = next(csv.reader([f.readline().decode('utf-8', errors='replace')]), ATTENDANCE_COLUMNS)
+            offset = f.tell()
+            if after and int(after):
+                start = int(after)
+                if start < offset or start > os.fstat(f.fileno()).st_size:
+                    raise ValueError(f"Attendance cursor {after} is outside the records")
+                f.seek(start - 1)
+                if f.read(1) != b'\n':
+                    raise ValueError(f"Attendance cursor {after} is not at the start of a row")
+                offset = start
+            count = 0
+            while limit is None or count < limit:
+                line = f.readline()
+                # A row still being appended is left for the next read
+                if not line.endswith(b'\n'):
+                    break
+                offset += len(line)
+                row = next(csv.reader([line.decode('utf-8', errors='replace')]), None)
+                if not row:
+                    continue
+                record = dict(zip(header, row))
+                if _matches(record, start_date, end_date, student, status):
+                    count += 1
+                    yield offset, record
+
+    def attendance_records(self, date=None):
+        """Attendance rows as dicts keyed by ATTENDANCE_COLUMNS"""
+        return [record for _, record in self.iter_attendance(start_date=date, end_date=date)]
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """Students, encodings and attendance in one SQLite database (WAL mode).
+
+    Each thread reuses its own connection. Attendance is indexed on
+    (date, student_id) and unique on (date, name), so dedup checks and
+    per-day reports stay fast however long the history grows.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS students (
+            name TEXT PRIMARY KEY,
+            student_id TEXT,
+            image_path TEXT,
+            added_date TEXT
+        );
+        CREATE TABLE IF NOT EXISTS encodings (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            student_id TEXT,
+            encoding BLOB NOT NULL,
+            kind TEXT,
+            quality REAL
+        );
+        CREATE TABLE IF NOT EXISTS attendance (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            student_id TEXT,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            status TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_attendance_date_student ON attendance (date, student_id);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_date_name ON attendance (date, name);
+        CREATE INDEX IF NOT EXISTS idx_encodings_name ON encodings (name);
+    """
+
+    def __init__(self, database_file="attendance.db"):
+        self.database_file = database_file
+        self._local = threading.local()
+        self._marked = set()
+        self._marked_lock = threading.Lock()
+        # Last encoding row and row count seen by load_encodings()/load_new_encodings()
+        self._encoding_id = 0
+        self._encoding_rows = 0
+        # Student count and last rowid when load_students() last read them
+        self._students_stamp = None
+        connection = self._connection()
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(encodings)")}
+        if columns and 'kind' not in columns:
+            # Databases created before templates (see face_templates.py)
+            with connection:
+                connection.execute("ALTER TABLE encodings ADD COLUMN kind TEXT")
+                connection.execute("ALTER TABLE encodings ADD COLUMN quality REAL")
+        connection.executescript(self.SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_file, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def is_empty(self):
+        connection = self._connection()
+        return not any(connection.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                       for table in ('students', 'encodings', 'attendance'))
+
+    def _students_table_stamp(self):
+        return self._connection().execute("SELECT COUNT(*), MAX(rowid) FROM students").fetchone()
+
+    def load_students(self):
+        self._students_stamp = self._students_table_stamp()
+        rows = self._connection().execute("SELECT name, student_id, image_path, added_date FROM students")
+        return {name: {'student_id': student_id, 'image_path': image_path, 'added_date': added_date}
+                for name, student_id, image_path, added_date in rows}
+
+    def save_students(self, students_data, names=None):
+        """Upsert the given students (all of them when names is None)"""
+        names = students_data.keys() if names is None else names
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO students (name, student_id, image_path, added_date) VALUES (?, ?, ?, ?)",
+                [(name, students_data[name].get('student_id'), students_data[name].get('image_path'),
+                  students_data[name].get('added_date')) for name in names])
+
+    def students_changed(self):
+        return self._students_table_stamp() != self._students_stamp
+
+    def load_encodings(self, students_data=None):
+        self._encoding_id = self._encoding_rows = 0
+        encodings, entries, _ = self.load_new_encodings()
+        return encodings, entries
+
+    def encodings_changed(self):
+        row = self._connection().execute("SELECT MAX(id) FROM encodings").fetchone()
+        return (row[0] or 0) > self._encoding_id
+
+    def load_new_encodings(self):
+        """Return (encodings, entries, start) for rows added since the last load.
+
+        Only the new rows are read; start is the gallery row the first one
+        goes to. Unlike the file store they are copied into each process.
+        """
+        rows = self._connection().execute("SELECT id, name, student_id, encoding, kind, quality FROM encodings "
+                                          "WHERE id > ? ORDER BY id", (self._encoding_id,)).fetchall()
+        start = self._encoding_rows
+        if rows:
+            self._encoding_id = rows[-1][0]
+            self._encoding_rows += len(rows)
+        return self._encoding_rows_to_arrays(rows) + (start,)
+
+    def load_student_encodings(self, names):
+        """{name: (encodings, entries)} of every stored row of several students"""
+        connection = self._connection()
+        # One indexed lookup per student rather than a scan of the table
+        return {name: self._encoding_rows_to_arrays(connection.execute(
+                    "SELECT id, name, student_id, encoding, kind, quality FROM encodings "
+                    "WHERE name = ? ORDER BY id", (name,)).fetchall())
+                for name in set(names)}
+
+    @staticmethod
+    def _encoding_rows_to_arrays(rows):
+        if not rows:
+            return np.empty((0, ENCODING_SIZE), dtype=np.float32), []
+        encodings = np.frombuffer(b''.join(row[3] for row in rows), dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        entries = []
+        for _, name, student_id, _, kind, quality in rows:
+            entry = {'name': name, 'student_id': student_id}
+            if kind is not None:
+                entry['kind'] = kind
+                entry['quality'] = quality
+            entries.append(entry)
+        return encodings, entries
+
+    def append_encodings(self, encodings, names, student_ids=None, kinds=None, qualities=None):
+        rows = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        count = len(rows)
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT INTO encodings (name, student_id, encoding, kind, quality) VALUES (?, ?, ?, ?, ?)",
+                [(name, student_id, row.tobytes(), kind, quality)
+                 for name, student_id, row, kind, quality in zip(names, student_ids or [None] * count, rows,
+                                                                 kinds or [None] * count,
+                                                                 qualities or [None] * count)])
+
+    def append_attendance(self, rows, sync=True):
+        connection = self._connection()
+        connection.execute(f"PRAGMA synchronous={'FULL' if sync else 'NORMAL'}")
+        with connection:
+            # The unique (date, name) index drops duplicates from other processes
+            connection.executemany(
+                "INSERT OR IGNORE INTO attendance (name, student_id, date, time, status) VALUES (?, ?, ?, ?, ?)",
+                [tuple(row) for row in rows])
+
+    def is_marked(self, name, date):
+        with self._marked_lock:
+            if (date, name) in self._marked:
+                return True
+        found = self._connection().execute("SELECT 1 FROM attendance WHERE date = ? AND name = ? LIMIT 1",
+                                           (date, name)).fetchone() is not None
+        if found:
+            self.add_marked(name, date)
+        return found
+
+    def add_marked(self, name, date):
+        with self._marked_lock:
+            self._marked.add((date, name))
+
+    def attendance_changed(self, after=None):
+        """True when rows were inserted (by any process) past cursor after"""
+        row = self._connection().execute("SELECT MAX(id) FROM attendance").fetchone()
+        return (row[0] or 0) > int(after or 0)
+
+    def iter_attendance(self, start_date=None, end_date=None, student=None, status=None, after=None,
+                        limit=None):
+        """Lazily yield (cursor, record) in insertion order; the cursor is the row id"""
+        after = int(after or 0)
+        if after < 0 or after > (self._connection().execute("SELECT MAX(id) FROM attendance").fetchone()[0] or 0):
+            raise ValueError(f"Attendance cursor {after} is outside the records")
+        clauses, params = ["id > ?"], [after]
+        if start_date:
+            clauses.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append("date <= ?")
+            params.append(end_date)
+        if student:
+            clauses.append("(name = ? OR student_id = ?)")
+            params.extend([student, student])
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        query = ("SELECT id, name, student_id, date, time, status FROM attendance WHERE "
+                 + " AND ".join(clauses) + " ORDER BY id")
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        for row in self._connection().execute(query, params):
+            yield row[0], dict(zip(ATTENDANCE_COLUMNS, row[1:]))
+
+    def attendance_records(self, date=None):
+        return [record for _, record in self.iter_attendance(start_date=date, end_date=date)]
+
+    def import_files(self, files):
+        """Copy everything from a FileStorage into this database"""
+        students_data = files.load_students()
+        self.save_students(students_data)
+        encodings, entries = files.load_encodings(students_data)
+        if entries:
+            self.append_encodings(encodings, [entry['name'] for entry in entries],
+                                  [entry.get('student_id') for entry in entries],
+                                  [entry.get('kind') for entry in entries],
+                                  [entry.get('quality') for entry in entries])
+        rows = [[record.get(column) for column in ATTENDANCE_COLUMNS]
+                for record in files.attendance_records()]
+        if rows:
+            self.append_attendance(rows)
+        print(f"Imported {len(students_data)} students, {len(entries)} face encodings "
+              f"and {len(rows)} attendance rows into {self.database_file}")
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def create_storage(backend="files", database_file="attendance.db", **file_paths):
+    """Storage by backend name ('files' or 'sqlite').
+
+    A new SQLite database is filled from the existing files on first use.
+    """
+    if backend == "files":
+        return FileStorage(**file_paths)
+    if backend == "sqlite":
+        storage = SQLiteStorage(database_file)
+        if storage.is_empty() and any(os.path.exists(path) for path in file_paths.values()):
+            storage.import_files(FileStorage(**file_paths))
+        return storage
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import the JSON/CSV/encoding files into a SQLite database")
+    parser.add_argument('database', help="SQLite database to create or extend")
+    parser.add_argument('--students', default="students_database.json")
+    parser.add_argument('--attendance', default="attendance_records.csv")
+    parser.add_argument('--encodings', default="face_encodings", help="Encoding store base path")
+    parser.add_argument('--pickle', default="face_encodings.pkl", help="Legacy encodings pickle")
+    args = parser.parse_args()
+
+    SQLiteStorage(args.database).import_files(
+        FileStorage(args.students, args.attendance, args.encodings, args.pickle))
@@ -0,0 +1,58 @@
+import numpy as np
+
+from ann_index import IVFIndex, create_index
+from face_gallery import ENCODING_SIZE
+
+
+def clustered(count, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, ENCODING_SIZE)) * 0.3
+    rows = centers[rng.integers(0, clusters, count)] + rng.standard_normal((count, ENCODING_SIZE)) * 0.05
+    return rows.astype(np.float32)
+
+
+def norms(matrix):
+    return np.einsum('ij,ij->i', matrix, matrix)
+
+
+def test_ivf_search_finds_stored_rows():
+    matrix = clustered(2000)
+    index = IVFIndex(nprobe=4)
+    index.build(matrix)
+    assert index.is_trained and len(index) == 2000
+
+    picks = np.arange(0, 2000, 37)
+    indices, distances = index.search(matrix[picks] + 0.001, matrix, norms(matrix))
+    assert np.mean(indices == picks) >= 0.95
+    assert np.all(distances < 0.1)
+
+
+def test_ivf_incremental_add():
+    matrix = clustered(1500)
+    index = IVFIndex(nprobe=8)
+    index.build(matrix[:1000])
+    index.add(matrix[1000:], 1000)
+    assert len(index) == 1500
+    indices, _ = index.search(matrix[[1200, 1499]], matrix, norms(matrix))
+    assert list(indices) == [1200, 1499]
+
+
+def test_ivf_save_and_load(tmp_path):
+    matrix = clustered(1000)
+    index = IVFIndex(nprobe=8)
+    index.build(matrix)
+    path = str(tmp_path / "enc.ivf.npz")
+    index.save(path)
+    assert [p.name for p in tmp_path.iterdir()] == ["enc.ivf.npz"]
+
+    loaded = IVFIndex(nprobe=8)
+    loaded.load(path)
+    assert len(loaded) == 1000 and loaded.trained_size == index.trained_size
+    queries = matrix[::50]
+    assert np.array_equal(loaded.search(queries, matrix, norms(matrix))[0],
+                          index.search(queries, matrix, norms(matrix))[0])
+
+
+def test_create_index_kinds():
+    assert create_index('exact') is None
+    assert create_index('ivf', probes=3).nprobe == 3
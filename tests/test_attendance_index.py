@@ -0,0 +1,37 @@
+from attendance_index import AttendanceIndex
+
+HEADER = 'Name,Student_ID,Date,Time,Status\r\n'
+
+
+def test_reads_existing_rows(tmp_path):
+    path = tmp_path / "attendance.csv"
+    path.write_text(HEADER + 'Ann,1,2024-01-01,09:00:00,Present\r\n', newline='')
+    index = AttendanceIndex(str(path))
+    assert index.contains('Ann', '2024-01-01')
+    assert not index.contains('Ann', '2024-01-02')
+    assert len(index) == 1
+
+
+def test_picks_up_appended_rows_only_when_complete(tmp_path):
+    path = tmp_path / "attendance.csv"
+    path.write_text(HEADER, newline='')
+    index = AttendanceIndex(str(path))
+    with open(path, 'a', newline='') as f:
+        f.write('Bob,2,2024-01-01,09:00:00,Present\r\nCat,3,2024-01-01,09:0')
+    assert index.contains('Bob', '2024-01-01')
+    assert not index.contains('Cat', '2024-01-01')
+    with open(path, 'a', newline='') as f:
+        f.write('1:00,Present\r\n')
+    assert index.contains('Cat', '2024-01-01')
+
+
+def test_add_and_reload_after_truncation(tmp_path):
+    path = tmp_path / "attendance.csv"
+    path.write_text(HEADER + 'Ann,1,2024-01-01,09:00:00,Present\r\n', newline='')
+    index = AttendanceIndex(str(path))
+    index.add('Dan', '2024-01-01')
+    assert index.contains('Dan', '2024-01-01')
+    # A replaced, shorter file is read again from the start
+    path.write_text(HEADER, newline='')
+    index.refresh()
+    assert not index.contains('Ann', '2024-01-01')
@@ -0,0 +1,121 @@
+import json
+import multiprocessing
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import file_lock
+from encoding_store import ROW_BYTES, EncodingStore
+from face_gallery import ENCODING_SIZE
+
+
+def rows(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, ENCODING_SIZE)).astype(np.float32)
+
+
+def test_append_and_load(tmp_path):
+    store = EncodingStore(str(tmp_path / "enc"))
+    first, second = rows(3, 1), rows(2, 2)
+    store.append(first, ["a", "b", "c"], ["1", "2", "3"])
+    store.append(second, ["d", "e"], kinds=["centroid", "exemplar"], qualities=[2.5, 0.9])
+
+    encodings, entries = EncodingStore(str(tmp_path / "enc")).load()
+    assert np.array_equal(encodings, np.vstack([first, second]))
+    assert [entry['name'] for entry in entries] == ["a", "b", "c", "d", "e"]
+    assert entries[0] == {'name': 'a', 'student_id': '1'}
+    assert entries[3] == {'name': 'd', 'student_id': None, 'kind': 'centroid', 'quality': 2.5}
+
+
+def test_migrate_from_pickle(tmp_path):
+    data = rows(2)
+    with open(tmp_path / "legacy.pkl", 'wb') as f:
+        pickle.dump({'encodings': list(data), 'names': ["a", "b"]}, f)
+    store = EncodingStore(str(tmp_path / "enc"))
+    store.migrate_from_pickle(str(tmp_path / "legacy.pkl"))
+    encodings, entries = store.load()
+    assert np.array_equal(encodings, data)
+    assert [entry['name'] for entry in entries] == ["a", "b"]
+
+
+def test_load_new_picks_up_rows_from_another_writer(tmp_path):
+    reader = EncodingStore(str(tmp_path / "enc"))
+    writer = EncodingStore(str(tmp_path / "enc"))
+    writer.append(rows(2), ["a", "b"])
+    reader.load()
+    assert not reader.changed()
+
+    writer.append(rows(1, 5), ["c"])
+    assert reader.changed()
+    encodings, entries = reader.load_new()
+    assert [entry['name'] for entry in entries] == ["c"]
+    assert len(encodings) == 3 and np.array_equal(encodings[2], rows(1, 5)[0])
+    assert not reader.changed()
+
+
+def test_rows_for_several_students(tmp_path):
+    store = EncodingStore(str(tmp_path / "enc"))
+    data = rows(4)
+    store.append(data, ["a", "b", "a", "c"])
+    found = store.rows_for(["a", "c", "missing"])
+    assert np.array_equal(found["a"][0], data[[0, 2]])
+    assert [entry['name'] for entry in found["c"][1]] == ["c"]
+    assert found["missing"][0].shape == (0, ENCODING_SIZE) and found["missing"][1] == []
+
+
+def test_repair_after_crash_between_files(tmp_path):
+    base = str(tmp_path / "enc")
+    store = EncodingStore(base)
+    store.append(rows(2), ["a", "b"])
+    # Crash mid-append: a data row without its name, and half a names line
+    with open(store.data_file, 'ab') as f:
+        f.write(rows(1, 9).tobytes())
+    with open(store.names_file, 'ab') as f:
+        f.write(b'{"name": "ha')
+
+    encodings, entries = EncodingStore(base).load()
+    assert len(encodings) == 2 and [entry['name'] for entry in entries] == ["a", "b"]
+    assert os.path.getsize(store.data_file) == 2 * ROW_BYTES
+
+    store.append(rows(1, 3), ["c"])
+    encodings, entries = EncodingStore(base).load()
+    assert [entry['name'] for entry in entries] == ["a", "b", "c"]
+    assert np.array_equal(encodings[2], rows(1, 3)[0])
+
+
+def test_repair_drops_names_without_data(tmp_path):
+    store = EncodingStore(str(tmp_path / "enc"))
+    store.append(rows(2), ["a", "b"])
+    with open(store.names_file, 'ab') as f:
+        f.write(json.dumps({'name': 'orphan'}).encode() + b'\n')
+
+    store.append(rows(1, 4), ["c"])
+    encodings, entries = EncodingStore(str(tmp_path / "enc")).load()
+    assert [entry['name'] for entry in entries] == ["a", "b", "c"]
+    assert np.array_equal(encodings[2], rows(1, 4)[0])
+
+
+def _append_many(base, worker, count):
+    store = EncodingStore(base)
+    for i in range(count):
+        # Every value of a row encodes its writer and sequence number
+        store.append(np.full((1, ENCODING_SIZE), worker * 1000 + i, dtype=np.float32), [f"{worker}-{i}"])
+
+
+@pytest.mark.skipif(file_lock.fcntl is None, reason="needs flock")
+def test_concurrent_appends_stay_aligned(tmp_path):
+    base = str(tmp_path / "enc")
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_append_many, args=(base, worker, 50)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+        assert process.exitcode == 0
+
+    encodings, entries = EncodingStore(base).load()
+    assert len(entries) == len(encodings) == 200
+    for encoding, entry in zip(encodings, entries):
+        worker, i = map(int, entry['name'].split('-'))
+        assert np.all(encoding == worker * 1000 + i)
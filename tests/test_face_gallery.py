@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex
+from face_gallery import ENCODING_SIZE, FaceGallery
+
+
+def gallery_rows(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((count, ENCODING_SIZE)) * 0.09).astype(np.float32), [f"s{i}" for i in range(count)]
+
+
+def test_match_returns_nearest_within_tolerance():
+    encodings, names = gallery_rows(50)
+    gallery = FaceGallery(encodings, names, tolerance=0.6)
+    queries = np.vstack([encodings[[3, 17]] + 0.01, np.full((1, ENCODING_SIZE), 5.0, dtype=np.float32)])
+    indices, distances = gallery.match(queries)
+    assert list(indices) == [3, 17, -1]
+    assert distances[0] < 0.2 and np.isfinite(distances[2])
+    assert gallery.match_names(queries) == ["s3", "s17", "Unknown"]
+
+
+def test_empty_gallery_matches_nothing():
+    indices, distances = FaceGallery().match(np.zeros((2, ENCODING_SIZE), dtype=np.float32))
+    assert list(indices) == [-1, -1] and np.all(np.isinf(distances))
+
+
+def test_distances_agree_with_numpy():
+    encodings, names = gallery_rows(20)
+    gallery = FaceGallery(encodings, names)
+    queries = gallery_rows(3, seed=1)[0]
+    expected = np.linalg.norm(queries[:, None, :] - encodings[None, :, :], axis=2)
+    assert np.allclose(gallery.distances(queries), expected, atol=1e-4)
+
+
+def test_extend_from_whole_store_and_from_offset():
+    encodings, names = gallery_rows(30)
+    gallery = FaceGallery.from_matrix(encodings[:10], names[:10])
+    gallery.extend(encodings[:20], names[10:20], 0)
+    assert len(gallery) == 20 and gallery.names[19] == "s19"
+    gallery.extend(encodings[20:], names[20:], 20)
+    assert len(gallery) == 30
+    assert gallery.match_names(encodings[[5, 15, 25]]) == ["s5", "s15", "s25"]
+
+
+def test_retire_excludes_rows():
+    encodings, names = gallery_rows(10)
+    gallery = FaceGallery(encodings, names)
+    gallery.retire([4])
+    assert gallery.active_size == 9
+    assert gallery.match_names(encodings[[4, 5]])[1] == "s5"
+    assert gallery.match(encodings[[4]])[0][0] != 4
+    assert gallery.distance(4, encodings[4]) == np.inf
+    assert gallery.distance(5, encodings[5]) == pytest.approx(0.0)
+
+
+def test_indexed_gallery_matches_new_rows():
+    encodings, names = gallery_rows(600)
+    gallery = FaceGallery(encodings[:500], names[:500], index=IVFIndex(nprobe=64), exact_threshold=100)
+    assert gallery.index.is_trained
+    gallery.add_many(encodings[500:], names[500:])
+    assert len(gallery.index) == 600
+    assert gallery.match_names(encodings[[42, 550]]) == ["s42", "s550"]
+
+
+def test_retired_rows_stay_out_of_the_index():
+    encodings, names = gallery_rows(600)
+    gallery = FaceGallery(encodings, names, index=IVFIndex(nprobe=64), exact_threshold=100)
+    gallery.retire([7])
+    assert gallery.match(encodings[[7]])[0][0] != 7
+    assert gallery.match_names(encodings[[8]]) == ["s8"]
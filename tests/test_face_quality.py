@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from face_quality import QualityGate, sharpness
+
+
+def textured(size=120, low=60, high=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(low, high, (size, size, 3)).astype(np.uint8)
+
+
+BOX = (10, 110, 110, 10)
+
+
+def landmarks(points):
+    return SimpleNamespace(part=lambda i: SimpleNamespace(x=points[i][0], y=points[i][1]))
+
+
+FRONTAL = [(30, 40), (40, 40), (80, 40), (70, 40), (55, 60)]
+TURNED = [(30, 40), (40, 40), (80, 40), (70, 40), (78, 60)]
+
+
+def test_accepts_a_sharp_well_lit_face():
+    gate = QualityGate()
+    assert gate.check(textured(), BOX) is None
+    assert gate.check_pose(landmarks(FRONTAL)) is None
+    assert gate.stats() == {'passed': 1, 'skipped': 0, 'skipped_by_reason': dict.fromkeys(gate.skipped, 0)}
+
+
+def test_rejection_reasons():
+    gate = QualityGate()
+    assert gate.check(textured(), (10, 20, 20, 10)) == 'small'
+    assert gate.check(np.full((120, 120, 3), 10, dtype=np.uint8), BOX) == 'dark'
+    assert gate.check(np.full((120, 120, 3), 250, dtype=np.uint8), BOX) == 'bright'
+    assert gate.check(np.full((120, 120, 3), 128, dtype=np.uint8), BOX) == 'low_contrast'
+    # Smooth gradient: plenty of contrast, no edges
+    gradient = np.tile(np.linspace(40, 220, 120, dtype=np.float32), (120, 1))
+    assert gate.check(np.repeat(gradient[..., None], 3, axis=2).astype(np.uint8), BOX) == 'blurry'
+    assert gate.check_pose(landmarks(TURNED)) == 'pose'
+    stats = gate.stats()
+    assert stats['skipped'] == 6 and stats['passed'] == 0
+    assert all(count == 1 for count in stats['skipped_by_reason'].values())
+
+
+def test_disabled_checks():
+    gate = QualityGate(min_face_size=None, min_sharpness=None, min_brightness=None, max_brightness=None,
+                       min_contrast=None, max_yaw=None, max_roll=None)
+    assert gate.check(np.full((120, 120, 3), 10, dtype=np.uint8), (10, 20, 20, 10)) is None
+    assert gate.check_pose(landmarks(TURNED)) is None
+
+
+def test_sharpness_of_flat_crop_is_zero():
+    assert sharpness(np.full((20, 20), 100.0, dtype=np.float32)) == 0.0
+    assert sharpness(np.zeros((2, 2), dtype=np.float32)) == 0.0
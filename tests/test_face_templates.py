@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from face_gallery import ENCODING_SIZE
+from face_templates import FaceTemplate, build_templates, current_rows, retired_rows
+
+
+def samples(count, seed=0, spread=0.05):
+    rng = np.random.default_rng(seed)
+    base = rng.standard_normal(ENCODING_SIZE) * 0.1
+    return (base + rng.standard_normal((count, ENCODING_SIZE)) * spread).astype(np.float32)
+
+
+def test_select_keeps_best_and_diverse_exemplars():
+    template = FaceTemplate(max_exemplars=3, min_spread=0.15)
+    base = np.zeros(ENCODING_SIZE, dtype=np.float32)
+    near = base.copy()
+    near[0] = 0.01
+    far = base.copy()
+    far[1] = 0.5
+    farther = base.copy()
+    farther[2] = 0.8
+    candidates = np.vstack([near, base, far, farther])
+    chosen, qualities = template._select(candidates, np.array([0.5, 1.0, 0.6, 0.6], dtype=np.float32))
+    # Best quality first; the near-duplicate is never kept
+    assert np.array_equal(chosen[0], base)
+    assert len(chosen) == 3
+    assert not any(np.array_equal(row, near) for row in chosen)
+    assert np.allclose(qualities, [1.0, 0.6, 0.6])
+
+
+def test_update_is_incremental_weighted_mean():
+    rows = samples(8)
+    qualities = np.linspace(0.2, 1.0, 8).astype(np.float32)
+    once = FaceTemplate()
+    once.update(rows, qualities)
+    twice = FaceTemplate()
+    twice.update(rows[:3], qualities[:3])
+    twice.update(rows[3:], qualities[3:])
+    assert np.allclose(once.centroid, twice.centroid, atol=1e-6)
+    assert once.weight == pytest.approx(twice.weight)
+    expected = (qualities[:, None] * rows).sum(axis=0) / qualities.sum()
+    assert np.allclose(once.centroid, expected, atol=1e-6)
+
+
+def test_rows_round_trip():
+    template = FaceTemplate()
+    template.update(samples(6, spread=0.2), np.ones(6))
+    encodings, kinds, qualities = template.rows()
+    assert kinds[0] == 'centroid' and set(kinds[1:]) == {'exemplar'}
+    entries = [{'name': 'a', 'kind': kind, 'quality': quality} for kind, quality in zip(kinds, qualities)]
+    restored = FaceTemplate.from_rows(encodings, entries)
+    assert np.allclose(restored.centroid, template.centroid)
+    assert len(restored) == len(template)
+
+
+def test_current_and_retired_rows():
+    entries = [{'name': 'a'}, {'name': 'b'}, {'name': 'a', 'kind': 'centroid'}, {'name': 'a', 'kind': 'exemplar'}]
+    assert current_rows(entries[:2]) == [0, 1]
+    assert current_rows([entry for entry in entries if entry['name'] == 'a']) == [1, 2]
+    assert retired_rows(['a', 'b', 'a', 'a'], entries[2:], 2) == [0]
+
+
+class RecordingStorage:
+    def __init__(self, stored):
+        self.stored = stored
+        self.calls = []
+
+    def load_student_encodings(self, names):
+        self.calls.append(list(names))
+        return {name: self.stored[name] for name in names}
+
+
+def test_build_templates_reads_storage_once():
+    old = FaceTemplate()
+    old.update(samples(3, seed=1), np.ones(3))
+    encodings, kinds, qualities = old.rows()
+    storage = RecordingStorage({'Ann': (encodings, [{'name': 'Ann', 'kind': kind, 'quality': quality}
+                                                     for kind, quality in zip(kinds, qualities)])})
+    students_data = {'Ann': {'student_id': '1', 'added_date': '2024-01-01'}}
+    students = [('Ann', '1', 'ann.jpg', samples(2, seed=1), [1.0, 1.0]),
+                ('Bob', '2', 'bob.jpg', samples(2, seed=2), [1.0, 1.0]),
+                ('Bob', '3', 'bob2.jpg', samples(2, seed=3), [1.0, 1.0])]
+
+    rows, labels, student_ids, row_kinds, _ = build_templates(storage, students_data, students, '2024-02-01')
+    assert storage.calls == [['Ann']]
+    assert set(labels) == {'Ann', 'Bob', 'Bob (3)'}
+    assert students_data['Ann']['added_date'] == '2024-01-01'
+    assert students_data['Bob (3)']['student_id'] == '3'
+    assert len(rows) == len(labels) == len(student_ids) == len(row_kinds)
+    assert row_kinds.count('centroid') == 3
@@ -0,0 +1,47 @@
+from metrics import MetricsRegistry
+
+
+def test_counter_render():
+    registry = MetricsRegistry()
+    faces = registry.counter('faces_total', "Faces seen", ('camera', 'outcome'))
+    faces.inc('room-1', 'matched')
+    faces.inc('room-1', 'matched', amount=2)
+    faces.inc('room "2"', 'unknown')
+    assert faces.value('room-1', 'matched') == 3
+
+    text = registry.render()
+    assert text.endswith('\n')
+    assert text.splitlines() == [
+        '# HELP faces_total Faces seen',
+        '# TYPE faces_total counter',
+        'faces_total{camera="room \\"2\\"",outcome="unknown"} 1',
+        'faces_total{camera="room-1",outcome="matched"} 3',
+    ]
+
+
+def test_histogram_render_is_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram('stage_seconds', "Stage time", ('stage',), buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 3.0):
+        latency.observe(value, 'detect')
+
+    lines = registry.render().splitlines()
+    assert lines[1] == '# TYPE stage_seconds histogram'
+    assert lines[2:5] == [
+        'stage_seconds_bucket{stage="detect",le="0.01"} 1',
+        'stage_seconds_bucket{stage="detect",le="0.1"} 3',
+        'stage_seconds_bucket{stage="detect",le="+Inf"} 4',
+    ]
+    assert lines[5].startswith('stage_seconds_sum{stage="detect"} 3.10')
+    assert lines[6] == 'stage_seconds_count{stage="detect"} 4'
+
+
+def test_histogram_summary():
+    registry = MetricsRegistry()
+    latency = registry.histogram('stage_seconds', "Stage time", ('stage',), buckets=(0.01, 0.1))
+    assert latency.summary('match') == {'count': 0}
+    for _ in range(10):
+        latency.observe(0.005, 'match')
+    summary = latency.summary('match')
+    assert summary['count'] == 10 and summary['mean_ms'] == 5.0
+    assert 0 < summary['p50_ms'] <= summary['p95_ms'] <= 10.0
@@ -0,0 +1,81 @@
+import numpy as np
+
+from face_gallery import ENCODING_SIZE, FaceGallery
+from recognition_cache import RecognitionCache
+
+
+def encoding(seed):
+    return (np.random.default_rng(seed).standard_normal(ENCODING_SIZE) * 0.09).astype(np.float32)
+
+
+def nudge(base, distance, seed=0):
+    direction = np.random.default_rng(seed).standard_normal(ENCODING_SIZE)
+    return (base + direction / np.linalg.norm(direction) * distance).astype(np.float32)
+
+
+def test_hit_needs_close_encoding():
+    cache = RecognitionCache()
+    face = encoding(1)
+    cache.put(face, 7)
+    assert cache.get(nudge(face, 0.1)) == 7
+    assert cache.get(nudge(face, 0.5)) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_unknown_is_not_cached():
+    cache = RecognitionCache()
+    cache.put(encoding(1), -1)
+    cache.put(encoding(2), None)
+    assert len(cache) == 0
+
+
+def test_hit_is_verified_against_the_gallery():
+    # The cached face was a borderline match; a face further from the
+    # student, though close to the cached one, must not inherit the name
+    student = encoding(1)
+    gallery = FaceGallery([student], ["Ann"], tolerance=0.6)
+    cached = nudge(student, 0.55, seed=1)
+    cache = RecognitionCache(threshold=0.3)
+    cache.put(cached, 0)
+
+    def verify(row, query):
+        return gallery.distance(row, query) < gallery.tolerance
+
+    far = nudge(cached, 0.29, seed=2)
+    assert gallery.distance(0, far) >= gallery.tolerance
+    assert cache.get(far, verify=verify) is None
+    assert cache.get(cached, verify=verify) == 0
+
+
+def test_retired_row_fails_verification():
+    student = encoding(1)
+    gallery = FaceGallery([student], ["Ann"])
+    cache = RecognitionCache()
+    cache.put(student, 0)
+    gallery.retire([0])
+    assert cache.get(student, verify=lambda row, query: gallery.distance(row, query) < gallery.tolerance) is None
+
+
+def test_entries_are_keyed_by_region():
+    cache = RecognitionCache()
+    face = encoding(1)
+    cache.put(face, 3, region=(100, 200, 200, 100))
+    assert cache.get(face, region=(110, 210, 210, 110)) == 3
+    assert cache.get(face, region=(100, 500, 200, 400)) is None
+    # Without a region either side, only the encoding counts
+    assert cache.get(face) == 3
+
+
+def test_entries_expire_and_evict():
+    cache = RecognitionCache(max_size=2, ttl=0.0)
+    cache.put(encoding(1), 1)
+    assert cache.get(encoding(1)) is None
+
+    cache = RecognitionCache(max_size=2)
+    cache.put(encoding(1), 1)
+    cache.put(encoding(2), 2)
+    cache.get(encoding(1))
+    cache.put(encoding(3), 3)
+    assert cache.get(encoding(1)) == 1
+    assert cache.get(encoding(2)) is None
+    assert len(cache) == 2
@@ -0,0 +1,180 @@
+import threading
+
+import numpy as np
+import pytest
+
+from attendance_summary import AttendanceSummary
+from face_gallery import ENCODING_SIZE
+from file_lock import file_lock
+from storage import attendance_page, create_storage, repair_tail, valid_cursor
+
+HEADER = b'Name,Student_ID,Date,Time,Status\r\n'
+ROW = b'Ann,1,2024-01-01,09:00:00,Present'
+
+
+@pytest.fixture(params=['files', 'sqlite'])
+def make_storage(request, tmp_path):
+    def make():
+        return create_storage(request.param, database_file=str(tmp_path / "attendance.db"),
+                              students_db=str(tmp_path / "students.json"),
+                              attendance_file=str(tmp_path / "attendance.csv"),
+                              encodings_base=str(tmp_path / "enc"),
+                              encodings_pickle=str(tmp_path / "missing.pkl"))
+    return make
+
+
+def rows(count, date='2024-01-01'):
+    return [[f"student_{i}", str(i), date, '09:00:00', 'Present'] for i in range(count)]
+
+
+@pytest.mark.parametrize('content, expected', [
+    (HEADER + ROW + b'\r\n', HEADER + ROW + b'\r\n'),
+    # Complete row that only lost its line break
+    (HEADER + ROW, HEADER + ROW + b'\r\n'),
+    (HEADER + ROW + b'\r', HEADER + ROW + b'\r\n'),
+    # Partial rows are dropped
+    (HEADER + ROW + b'\r\nBob,2,2024-', HEADER + ROW + b'\r\n'),
+    (HEADER + b'Bob,2', HEADER),
+    # The header is never removed
+    (HEADER.rstrip(), HEADER),
+    (b'Name,Stud', HEADER),
+])
+def test_repair_tail(tmp_path, content, expected):
+    path = tmp_path / "attendance.csv"
+    path.write_bytes(content)
+    repair_tail(str(path))
+    assert path.read_bytes() == expected
+
+
+def test_repair_waits_for_a_writer_holding_the_lock(tmp_path):
+    path = tmp_path / "attendance.csv"
+    path.write_bytes(HEADER)
+    paths = dict(students_db=str(tmp_path / "students.json"), attendance_file=str(path),
+                 encodings_base=str(tmp_path / "enc"))
+    with file_lock(str(path) + ".lock"):
+        # Another worker is midway through appending a row
+        with open(path, 'ab') as f:
+            f.write(ROW[:10])
+        opening = threading.Thread(target=create_storage, args=('files',), kwargs=paths)
+        opening.start()
+        opening.join(0.2)
+        assert opening.is_alive()
+        with open(path, 'ab') as f:
+            f.write(ROW[10:] + b'\r\n')
+    opening.join()
+    assert path.read_bytes() == HEADER + ROW + b'\r\n'
+
+
+def test_students_encodings_and_marks_round_trip(make_storage):
+    storage = make_storage()
+    storage.save_students({'Ann': {'student_id': '1', 'image_path': 'ann.jpg', 'added_date': '2024-01-01'}})
+    encodings = np.ones((2, ENCODING_SIZE), dtype=np.float32)
+    storage.append_encodings(encodings, ['Ann', 'Ann'], ['1', '1'])
+    storage.append_attendance(rows(1))
+
+    reopened = make_storage()
+    assert reopened.load_students()['Ann']['student_id'] == '1'
+    loaded, entries = reopened.load_encodings()
+    assert np.array_equal(loaded, encodings) and [entry['name'] for entry in entries] == ['Ann', 'Ann']
+    assert reopened.is_marked('student_0', '2024-01-01')
+    assert not reopened.is_marked('student_0', '2024-01-02')
+    assert reopened.attendance_records('2024-01-01')[0]['Name'] == 'student_0'
+
+
+def test_students_changed_by_another_worker(make_storage):
+    storage = make_storage()
+    other = make_storage()
+    storage.load_students()
+    assert not storage.students_changed()
+    other.save_students({'Ann': {'student_id': '1'}})
+    assert storage.students_changed()
+    assert set(storage.load_students()) == {'Ann'}
+    assert not storage.students_changed()
+
+
+def test_sqlite_imports_existing_files(tmp_path):
+    paths = dict(students_db=str(tmp_path / "students.json"), attendance_file=str(tmp_path / "attendance.csv"),
+                 encodings_base=str(tmp_path / "enc"), encodings_pickle=str(tmp_path / "missing.pkl"))
+    files = create_storage('files', **paths)
+    files.save_students({'Ann': {'student_id': '1'}})
+    files.append_attendance(rows(2))
+
+    database = create_storage('sqlite', database_file=str(tmp_path / "attendance.db"), **paths)
+    assert set(database.load_students()) == {'Ann'}
+    assert len(database.attendance_records()) == 2
+
+
+def test_iter_attendance_cursors(make_storage):
+    storage = make_storage()
+    storage.append_attendance(rows(5))
+    storage.append_attendance(rows(3, '2024-01-02'))
+
+    first, cursor = attendance_page(storage, limit=3)
+    assert [record['Name'] for record in first] == ["student_0", "student_1", "student_2"]
+    second, cursor = attendance_page(storage, limit=3, cursor=cursor)
+    assert [record['Name'] for record in second] == ["student_3", "student_4", "student_0"]
+    last, cursor = attendance_page(storage, limit=3, cursor=cursor)
+    assert [record['Date'] for record in last] == ['2024-01-02'] * 2
+    assert cursor is None
+
+    on_day_two = [record for _, record in storage.iter_attendance(start_date='2024-01-02')]
+    assert len(on_day_two) == 3
+    assert storage.is_marked("student_4", '2024-01-01') and not storage.is_marked("student_4", '2024-01-02')
+
+
+def test_invalid_cursors_are_rejected(make_storage):
+    storage = make_storage()
+    storage.append_attendance(rows(2))
+    cursors = [cursor for cursor, _ in storage.iter_attendance()]
+    assert all(valid_cursor(storage, str(cursor)) for cursor in cursors)
+    assert valid_cursor(storage, '0')
+    assert not valid_cursor(storage, 'abc')
+    assert not valid_cursor(storage, '-1')
+    assert not valid_cursor(storage, str(cursors[-1] + 1))
+
+
+def test_file_cursor_must_start_a_row(tmp_path):
+    storage = create_storage('files', students_db=str(tmp_path / "students.json"),
+                             attendance_file=str(tmp_path / "attendance.csv"), encodings_base=str(tmp_path / "enc"))
+    storage.append_attendance(rows(2))
+    first = next(storage.iter_attendance())[0]
+    # Inside the header, or in the middle of a row
+    assert not valid_cursor(storage, '3')
+    assert not valid_cursor(storage, str(first - 2))
+    with pytest.raises(ValueError):
+        list(storage.iter_attendance(after=first + 1))
+    assert [record['Name'] for _, record in storage.iter_attendance(after=first)] == ["student_1"]
+
+
+def test_attendance_changed_follows_cursor(make_storage):
+    storage = make_storage()
+    storage.append_attendance(rows(2))
+    cursor = list(storage.iter_attendance())[-1][0]
+    assert not storage.attendance_changed(cursor)
+    make_storage().append_attendance(rows(1, '2024-01-02'))
+    assert storage.attendance_changed(cursor)
+    assert [record['Date'] for _, record in storage.iter_attendance(after=cursor)] == ['2024-01-02']
+
+
+def test_summary_sees_rows_from_other_writers(make_storage):
+    summary = AttendanceSummary(make_storage())
+    assert summary.summary(4)['session_days'] == 0
+
+    make_storage().append_attendance(rows(2))
+    result = summary.summary(4)
+    assert result['days'] == [{'date': '2024-01-01', 'present': 2, 'first_seen': '09:00:00', 'percentage': 50.0}]
+
+    # Rows committed here and read back from storage are counted once
+    summary.add(rows(3, '2024-01-02'))
+    make_storage().append_attendance(rows(3, '2024-01-02'))
+    assert summary.day('2024-01-02', 4)['present'] == 3
+    assert {student['name']: student['days_present'] for student in summary.summary(4)['students']} == {
+        "student_0": 2, "student_1": 2, "student_2": 1}
+
+
+def test_save_students_merges_named_students(make_storage):
+    storage = make_storage()
+    storage.save_students({'a': {'student_id': '1'}})
+    other = make_storage()
+    other.save_students({'b': {'student_id': '2'}, 'stale': {}}, names=['b'])
+    assert set(storage.load_students()) == {'a', 'b'}
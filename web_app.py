@@ -1,22 +1,42 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response
 import os
+import sys
 import json
-import pandas as pd
 from datetime import datetime
+from werkzeug.local import LocalProxy
 from werkzeug.utils import secure_filename
 import base64
-import cv2
-import numpy as np
-import face_recognition
-import pickle
 import threading
-import time
 import csv
+import io
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Only light modules here: OpenCV, dlib/face_recognition and the camera
+# stack are imported by the routes that need them (see warm_up)
+from ann_index import create_index, index_path
+from attendance_summary import AttendanceSummary
+from attendance_writer import AttendanceWriter
+from recognition_cache import RecognitionCache
+from face_gallery import ENCODING_SIZE, FaceGallery
+from face_templates import build_templates, retired_rows
+from file_lock import file_lock, temp_path
+from metrics import REGISTRY
+from storage import ATTENDANCE_COLUMNS, attendance_page, create_storage, valid_cursor
+
+# Startup timings in seconds, reported by /health
+STARTUP = {}
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
 app.config['UPLOAD_FOLDER'] = 'student_images'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_RECOGNIZE_IMAGES'] = 32  # frames + face crops per /recognize request
+app.config['MAX_EMBEDDINGS'] = 256  # encodings per /embeddings request
 
 # Create upload directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -25,87 +45,299 @@ class AttendanceWebSystem:
     def __init__(self):
         self.students_db = "students_database.json"
         self.attendance_file = "attendance_records.csv"
+        # Legacy pickle, migrated once into the memory-mapped store
         self.encodings_file = "face_encodings.pkl"
-        self.camera = None
-        self.is_streaming = False
-        self.attendance_session_active = False
+        # Storage backend: 'files' (JSON/CSV/encoding store) or 'sqlite' (see storage.py)
+        self.storage_backend = "files"
+        self.database_file = "attendance.db"
+        # Bulk enrollment job status, shared by all gunicorn workers
+        self.bulk_jobs_file = "bulk_jobs.json"
+        self.max_bulk_jobs = 100
+        # ANN index for large galleries: 'auto', 'ivf', 'hnsw' or 'exact'
+        self.match_index = "auto"
+        self.match_probes = None
+        # {camera_id: device index, RTSP/HTTP URL or video file}
+        self.cameras_file = "cameras.json"
+        # Live stream and recognition rates are independent, per camera
+        self.stream_fps = 15
+        self.recognition_fps = 5
+        # Recognition pool shared by all cameras, and passes in flight per camera
+        self.recognition_workers = os.cpu_count() or 2
+        self.max_in_flight = 2
+        # Face tracking: detect every N recognition passes, re-encode tracks every
+        # M passes, optionally move boxes in between with an OpenCV tracker
+        # ('KCF', 'CSRT'). Passes already run at only recognition_fps, so by
+        # default (None) every pass detects unless cv_tracker is set.
+        self.detect_interval = None
+        self.track_refresh_interval = 30
+        self.cv_tracker = None
+        # Face detector: 'hog', 'cnn', 'dnn', 'yunet' or 'haar' (see face_detector.py)
+        self.detector_backend = "hog"
+        self.detection_scale = 0.25
+        self.adaptive_scale = False
+        # Recent match results reused for near-identical faces (see recognition_cache.py)
+        self.recognition_cache_size = 256
+        self.recognition_cache_ttl = 10.0
+        # Faces too small, blurred, badly lit or turned away are not encoded:
+        # QualityGate thresholds overriding its defaults (see face_quality.py),
+        # e.g. {'min_face_size': 32}; None disables the gate
+        self.face_quality = {}
+        # Seconds between checks for students enrolled by other workers
+        self.gallery_refresh_interval = 1.0
+        # Attendance rows are group-committed by a writer thread; fsync policy
+        # is 'batch', 'interval' or 'never' (see attendance_writer.py)
+        self.attendance_flush_interval = 0.5
+        self.attendance_fsync = "batch"
+        self.attendance_lock = threading.Lock()
+        self._gallery = None
+        self._cameras = None
+        self._upload_pool = None
+        # Bulk enrollment runs one job at a time in the background
+        self._bulk_pool = None
+        self._load_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._enroll_lock = threading.Lock()
+        self._watcher_pid = None
+        self.storage = create_storage(self.storage_backend, database_file=self.database_file,
+                                      students_db=self.students_db, attendance_file=self.attendance_file,
+                                      encodings_base="face_encodings", encodings_pickle=self.encodings_file)
         self.load_data()
-        self.setup_attendance_file()
+        # Started now rather than with the gallery, so a worker that only
+        # serves student lists and reports still sees new students
+        self.start_watcher()
+        # Rollups for reports, kept current as the writer commits rows
+        self.attendance_summary = AttendanceSummary(self.storage)
+        self.attendance_writer = AttendanceWriter(self.storage, self.attendance_flush_interval,
+                                                  fsync=self.attendance_fsync,
+                                                  on_commit=self.attendance_summary.add)
+    
+    @property
+    def gallery(self):
+        """Face gallery, loaded on first use"""
+        if self._gallery is None:
+            with self._load_lock:
+                if self._gallery is None:
+                    started = time.perf_counter()
+                    self._gallery = self.load_gallery()
+                    STARTUP['gallery_seconds'] = round(time.perf_counter() - started, 3)
+        self.start_watcher()
+        return self._gallery
+    
+    def start_watcher(self):
+        """Start this process's thread picking up other workers' enrollments"""
+        if self._watcher_pid != os.getpid():
+            # Threads do not survive a fork, so each worker starts its own
+            self._watcher_pid = os.getpid()
+            threading.Thread(target=self.watch_gallery, daemon=True).start()
+    
+    @property
+    def cameras(self):
+        """Camera sessions, created (with the OpenCV stack) on first use"""
+        if self._cameras is None:
+            with self._load_lock:
+                if self._cameras is None:
+                    from camera_manager import SessionManager, load_camera_sources
+                    self._cameras = SessionManager(self.create_recognizer, load_camera_sources(self.cameras_file),
+                                                   stream_fps=self.stream_fps,
+                                                   recognition_fps=self.recognition_fps,
+                                                   workers=self.recognition_workers,
+                                                   max_in_flight=self.max_in_flight)
+        return self._cameras
+    
+    @property
+    def upload_pool(self):
+        """(executor, detector) shared by /recognize requests, created on first use"""
+        if self._upload_pool is None:
+            with self._load_lock:
+                if self._upload_pool is None:
+                    from face_detector import create_detector
+                    executor = ThreadPoolExecutor(max_workers=self.recognition_workers, thread_name_prefix='upload')
+                    self._upload_pool = (executor, create_detector(self.detector_backend,
+                                                                   scale=self.detection_scale))
+        return self._upload_pool
     
     def load_data(self):
-        """Load existing data"""
-        try:
-            with open(self.students_db, 'r') as f:
-                self.students_data = json.load(f)
-        except FileNotFoundError:
-            self.students_data = {}
+        """Load the student database; encodings are loaded with the gallery"""
+        self.students_data = self.storage.load_students()
+    
+    def load_gallery(self):
+        """Load face encodings into a gallery with its ANN index"""
+        encodings, entries = self.storage.load_encodings(self.students_data)
+        gallery = FaceGallery.from_matrix(encodings, [entry['name'] for entry in entries], tolerance=0.6)
         
-        try:
-            with open(self.encodings_file, 'rb') as f:
-                data = pickle.load(f)
-                self.known_face_encodings = data['encodings']
-                self.known_face_names = data['names']
-        except FileNotFoundError:
-            self.known_face_encodings = []
-            self.known_face_names = []
+        index = create_index(self.match_index, self.match_probes)
+        if index is not None:
+            gallery.attach_index(index, index_path(self.encodings_file, index))
+        gallery.retire(retired_rows(gallery.names, entries, 0))
+        return gallery
+    
+    @property
+    def gallery_version(self):
+        """Encoding rows loaded into this worker's gallery"""
+        return len(self._gallery) if self._gallery is not None else 0
     
-    def save_data(self):
-        """Save data to files"""
-        with open(self.students_db, 'w') as f:
-            json.dump(self.students_data, f, indent=2)
+    def refresh_gallery(self):
+        """Pick up encodings appended by any worker since the last check.
         
-        data = {
-            'encodings': self.known_face_encodings,
-            'names': self.known_face_names
-        }
-        with open(self.encodings_file, 'wb') as f:
-            pickle.dump(data, f)
-    
-    def setup_attendance_file(self):
-        """Setup attendance CSV file with headers"""
-        if not os.path.exists(self.attendance_file):
-            with open(self.attendance_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Name', 'Student_ID', 'Date', 'Time', 'Status'])
-    
-    def add_student(self, name, student_id, image_path):
-        """Add new student"""
+        With the file backend the gallery stays a read-only map of the
+        shared encoding store, so memory does not grow with the number of
+        gunicorn workers; only the new rows are read.
+        """
+        if self._gallery is None or not self.storage.encodings_changed():
+            return 0
+        with self._refresh_lock:
+            encodings, entries, start = self.storage.load_new_encodings()
+            if not entries:
+                return 0
+            if any(entry['name'] not in self.students_data for entry in entries):
+                # Students are saved before their encodings
+                self.refresh_students()
+            first_row = len(self._gallery)
+            self._gallery.extend(encodings, [entry['name'] for entry in entries], start)
+            self._gallery.retire(retired_rows(self._gallery.names, entries, first_row))
+            return len(entries)
+    
+    def refresh_students(self):
+        """Pick up students saved by any worker since the last check"""
+        if self.storage.students_changed():
+            self.students_data.update(self.storage.load_students())
+    
+    def watch_gallery(self):
+        while True:
+            time.sleep(self.gallery_refresh_interval)
+            try:
+                self.refresh_students()
+                added = self.refresh_gallery()
+                if added:
+                    print(f"Loaded {added} new face encodings (gallery version {self.gallery_version})")
+            except Exception as e:
+                print(f"Error refreshing face gallery: {e}")
+    
+    def warm_up(self):
+        """Load the gallery and the recognition stack ahead of the first request"""
+        started = time.perf_counter()
+        print(f"Loaded {len(self.gallery)} face encodings")
+        self.create_recognizer()
+        self.cameras
+        STARTUP['warm_up_seconds'] = round(time.perf_counter() - started, 3)
+        print(f"Warm-up finished in {STARTUP['warm_up_seconds']}s")
+    
+    def save_data(self, encodings=(), names=(), student_ids=None, kinds=None, qualities=None):
+        """Save the new students, append their face encodings and load them"""
+        self.storage.save_students(self.students_data, list(dict.fromkeys(names)))
+        
+        if len(names):
+            self.storage.append_encodings(encodings, names, student_ids, kinds, qualities)
+            self.refresh_gallery()
+            self.gallery.save_index()
+    
+    def enroll(self, students):
+        """Create or update the templates of (name, student_id, image_path, encodings, qualities) students"""
+        with self._enroll_lock:
+            rows = build_templates(self.storage, self.students_data, students, datetime.now().isoformat())
+            self.save_data(*rows)
+    
+    def add_student(self, name, student_id, image_paths):
+        """Add a student from one or more photos, or add photos to an enrolled student_id"""
+        if isinstance(image_paths, str):
+            # A single photo, as add_student() took before multi-photo enrollment
+            image_paths = [image_paths]
         try:
-            image = face_recognition.load_image_file(image_path)
-            face_encodings = face_recognition.face_encodings(image)
-            
-            if len(face_encodings) == 0:
-                return False, "No face detected in image"
+            from bulk_enroll import encode_image
+            samples = []
+            errors = []
+            for image_path in image_paths:
+                sample, error = encode_image(image_path)
+                if error:
+                    errors.append(f"{os.path.basename(image_path)}: {error}")
+                else:
+                    samples.append(sample)
             
-            self.students_data[name] = {
-                'student_id': student_id,
-                'image_path': image_path,
-                'added_date': datetime.now().isoformat()
-            }
+            if not samples:
+                return False, "; ".join(errors)
             
-            self.known_face_encodings.append(face_encodings[0])
-            self.known_face_names.append(name)
-            self.save_data()
+            self.enroll([(name, student_id, image_paths[0], [encoding for encoding, _ in samples],
+                          [quality for _, quality in samples])])
             
-            return True, "Student added successfully"
+            message = f"Enrolled from {len(samples)} photo(s)."
+            if errors:
+                message += f" Skipped {'; '.join(errors)}"
+            return True, message
         except Exception as e:
             return False, str(e)
     
-    def mark_attendance(self, name):
-        """Mark attendance for a student"""
+    def bulk_enroll(self, source, workers=None, per_student_folders=False):
+        """Enroll every student photo in a directory or zip archive"""
+        from bulk_enroll import collect_source, encode_images, group_by_student
+        extract_dir = os.path.join(app.config['UPLOAD_FOLDER'], os.path.splitext(os.path.basename(source))[0])
+        entries = collect_source(source, extract_dir, per_student_folders)
+        enrolled, failures = encode_images(entries, workers)
+        students = group_by_student(enrolled)
+        
+        if students:
+            self.enroll(students)
+        
+        return len(students), failures
+    
+    def start_bulk_enroll(self, source, per_student_folders=False):
+        """Queue a bulk enrollment and return its job id"""
+        job_id = uuid.uuid4().hex[:12]
+        self.save_bulk_job(job_id, {'status': 'queued', 'source': os.path.basename(source)})
+        with self._load_lock:
+            if self._bulk_pool is None:
+                self._bulk_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bulk-enroll')
+        self._bulk_pool.submit(self._run_bulk_enroll, job_id, source, per_student_folders)
+        return job_id
+    
+    def _run_bulk_enroll(self, job_id, source, per_student_folders):
+        job = {'status': 'running', 'source': os.path.basename(source)}
+        self.save_bulk_job(job_id, job)
+        try:
+            enrolled, failures = self.bulk_enroll(source, per_student_folders=per_student_folders)
+        except Exception as e:
+            enrolled, failures = 0, [{'image': source, 'error': str(e)}]
+        job.update(status='done', enrolled=enrolled, failed=len(failures), failures=failures)
+        self.save_bulk_job(job_id, job)
+    
+    def load_bulk_jobs(self):
+        try:
+            with open(self.bulk_jobs_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    
+    def save_bulk_job(self, job_id, job):
+        """Record a job's status in the jobs file, keeping the most recent jobs"""
+        with file_lock(self.bulk_jobs_file + ".lock"):
+            jobs = self.load_bulk_jobs()
+            jobs.pop(job_id, None)
+            jobs[job_id] = job
+            jobs = dict(list(jobs.items())[-self.max_bulk_jobs:])
+            temp_file = temp_path(self.bulk_jobs_file)
+            with open(temp_file, 'w') as f:
+                json.dump(jobs, f, indent=2)
+            os.replace(temp_file, self.bulk_jobs_file)
+    
+    def bulk_job(self, job_id):
+        """Status of a bulk enrollment job started by any worker"""
+        return self.load_bulk_jobs().get(job_id)
+    
+    def mark_attendance(self, name, when=None):
+        """Mark attendance for a student, at `when` (default: now)"""
         if name in self.students_data:
-            now = datetime.now()
+            now = when or datetime.now()
             date_str = now.strftime("%Y-%m-%d")
             time_str = now.strftime("%H:%M:%S")
             
-            # Check if already marked today
-            if self.is_already_marked_today(name, date_str):
-                return False, "Already marked today"
-            
-            # Mark attendance
-            with open(self.attendance_file, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
+            # Recognition workers run concurrently; check and write under one lock
+            with self.attendance_lock:
+                # Check if already marked today
+                if self.is_already_marked_today(name, date_str):
+                    return False, "Already marked today"
+                
+                # Record in the index first so duplicates are rejected before the row hits disk
+                self.storage.add_marked(name, date_str)
+                self.attendance_writer.submit([
                     name,
                     self.students_data[name]['student_id'],
                     date_str,
@@ -118,134 +350,129 @@ class AttendanceWebSystem:
     
     def is_already_marked_today(self, name, date):
         """Check if attendance is already marked for today"""
-        try:
-            df = pd.read_csv(self.attendance_file)
-            today_records = df[(df['Name'] == name) & (df['Date'] == date)]
-            return len(today_records) > 0
-        except:
-            return False
+        return self.storage.is_marked(name, date)
     
     def get_attendance_data(self, date=None):
         """Get attendance data"""
-        try:
-            df = pd.read_csv(self.attendance_file)
-            if date:
-                df = df[df['Date'] == date]
-            return df.to_dict('records')
-        except FileNotFoundError:
-            return []
+        self.attendance_writer.flush()
+        return self.storage.attendance_records(date)
+    
+    def get_attendance_page(self, limit=100, cursor=None, **filters):
+        """One page of attendance records and the cursor of the next page"""
+        self.attendance_writer.flush()
+        return attendance_page(self.storage, limit, cursor, **filters)
+    
+    def valid_cursor(self, cursor):
+        """Whether cursor came from a page of attendance records"""
+        return valid_cursor(self.storage, cursor)
+    
+    def iter_attendance(self, cursor=None, **filters):
+        """Lazily iterate attendance records, for streamed exports"""
+        self.attendance_writer.flush()
+        return (record for _, record in self.storage.iter_attendance(after=cursor, **filters))
+    
+    def get_attendance_summary(self):
+        """Cached per-day and per-student aggregates"""
+        return self.attendance_summary.summary(len(self.students_data))
     
     def get_students_list(self):
         """Get list of all students"""
         return self.students_data
     
-    def start_camera(self):
-        """Start camera for streaming"""
-        if not self.is_streaming:
-            self.camera = cv2.VideoCapture(0)
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            self.is_streaming = True
-            return True
-        return False
-    
-    def stop_camera(self):
+    def start_camera(self, camera_id=None):
+        """Start a camera for streaming"""
+        return self.cameras.get(camera_id).start()
+    
+    def stop_camera(self, camera_id=None):
         """Stop camera streaming"""
-        if self.is_streaming and self.camera:
-            self.camera.release()
-            self.is_streaming = False
-            self.attendance_session_active = False
-            return True
-        return False
-    
-    def generate_frames(self):
-        """Generate video frames for streaming"""
-        frame_count = 0
-        process_this_frame = True
+        return self.cameras.get(camera_id).stop()
+    
+    def create_recognizer(self, camera_id='default'):
+        """Frame recognizer that marks attendance for matched faces"""
+        from face_detector import create_detector
+        from face_quality import QualityGate
+        from recognition import FrameRecognizer
         
-        while self.is_streaming:
-            if not self.camera:
-                break
-                
-            ret, frame = self.camera.read()
-            if not ret:
-                break
-            
-            # Process face recognition if attendance session is active
-            if self.attendance_session_active and process_this_frame:
-                # Resize frame for faster processing
-                small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-                
-                try:
-                    # Find faces in current frame
-                    face_locations = face_recognition.face_locations(rgb_small_frame)
-                    
-                    if face_locations:
-                        # Get face encodings
-                        face_encodings = []
-                        for face_location in face_locations:
-                            try:
-                                encoding = face_recognition.face_encodings(rgb_small_frame, [face_location], num_jitters=1)
-                                if encoding:
-                                    face_encodings.append(encoding[0])
-                                else:
-                                    face_encodings.append(None)
-                            except:
-                                face_encodings.append(None)
-                        
-                        # Process each face
-                        for face_encoding, face_location in zip(face_encodings, face_locations):
-                            if face_encoding is None:
-                                continue
-                            
-                            # Compare with known faces
-                            matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=0.6)
-                            name = "Unknown"
-                            
-                            # Find best match
-                            if True in matches:
-                                face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                                best_match_index = np.argmin(face_distances)
-                                
-                                if matches[best_match_index] and face_distances[best_match_index] < 0.6:
-                                    name = self.known_face_names[best_match_index]
-                                    
-                                    # Mark attendance
-                                    success, message = self.mark_attendance(name)
-                                    if success:
-                                        print(f"✓ {message}")
-                            
-                            # Draw rectangle and label (scale back up)
-                            top, right, bottom, left = face_location
-                            top *= 4
-                            right *= 4
-                            bottom *= 4
-                            left *= 4
-                            
-                            color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
-                            cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-                            cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
-                            
-                            font = cv2.FONT_HERSHEY_DUPLEX
-                            cv2.putText(frame, name, (left + 6, bottom - 6), font, 0.6, (255, 255, 255), 1)
-                
-                except Exception as e:
-                    print(f"Error processing frame: {e}")
-            
-            process_this_frame = not process_this_frame
-            
-            # Encode frame as JPEG
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            
-            time.sleep(0.1)  # Small delay to prevent excessive CPU usage
+        def on_match(name):
+            success, message = self.mark_attendance(name)
+            if success:
+                print(f"✓ {message}")
+        
+        detector = create_detector(self.detector_backend, scale=self.detection_scale,
+                                   adaptive=self.adaptive_scale)
+        return FrameRecognizer(self.gallery, on_match, detector,
+                               detect_interval=self.detect_interval or (2 if self.cv_tracker else 1),
+                               refresh_interval=self.track_refresh_interval,
+                               cv_tracker=self.cv_tracker,
+                               cache=RecognitionCache(self.recognition_cache_size, self.recognition_cache_ttl),
+                               camera_id=camera_id,
+                               quality_gate=QualityGate(camera_id=camera_id, **self.face_quality)
+                               if self.face_quality is not None else None)
+    
+    def recognize_images(self, frames=(), faces=(), mark=False):
+        """Recognize uploaded frames (faces detected) and face crops.
+        
+        Images are decoded, detected and encoded concurrently; every face of
+        the request is then matched in one gallery search.
+        """
+        from recognition import recognize_image
+        executor, detector = self.upload_pool
+        jobs = [(data, detector) for data in frames] + [(data, None) for data in faces]
+        decoded = list(executor.map(lambda job: recognize_image(*job), jobs))
+        
+        matches = iter(self.match_encodings([encoding for found in decoded if found for _, encoding in found],
+                                            mark))
+        
+        results = []
+        for found in decoded:
+            if found is None:
+                results.append({'error': 'Could not decode image'})
+                continue
+            results.append({'faces': [dict(next(matches), box={'top': top, 'right': right,
+                                                               'bottom': bottom, 'left': left})
+                                      for (top, right, bottom, left), _ in found]})
+        return {'frames': results[:len(frames)], 'faces': results[len(frames):]}
+    
+    def match_encodings(self, encodings, mark=False):
+        """Match encodings in one gallery search, optionally marking attendance"""
+        indices, distances = self.gallery.match(encodings)
+        names = self.gallery.names
+        results = []
+        for index, distance in zip(indices.tolist(), distances.tolist()):
+            match = {
+                'name': names[index] if index >= 0 else "Unknown",
+                'distance': round(distance, 4) if index >= 0 else None,
+            }
+            if mark and index >= 0:
+                match['marked'], match['message'] = self.mark_attendance(match['name'])
+            results.append(match)
+        return results
+    
+    def generate_frames(self, camera_id=None):
+        """Generate video frames for streaming"""
+        camera = self.cameras.get(camera_id)
+        if not camera or not camera.is_streaming:
+            return
+        # One encoder per camera; every viewer shares its output
+        yield from camera.pipeline.stream()
+
+_attendance_system = None
+_attendance_system_lock = threading.Lock()
 
-# Initialize the system
-attendance_system = AttendanceWebSystem()
+def get_attendance_system():
+    """The AttendanceWebSystem, created on first use"""
+    global _attendance_system
+    if _attendance_system is None:
+        with _attendance_system_lock:
+            if _attendance_system is None:
+                started = time.perf_counter()
+                _attendance_system = AttendanceWebSystem()
+                STARTUP['system_seconds'] = round(time.perf_counter() - started, 3)
+    return _attendance_system
+
+# Created on first use, so importing the app (gunicorn worker spawn, Vercel
+# cold start) does not load any data
+attendance_system = LocalProxy(get_attendance_system)
 
 @app.route('/')
 def index():
@@ -262,84 +489,307 @@ def add_student():
         name = request.form['name']
         student_id = request.form['student_id']
         
-        if 'image' not in request.files:
+        files = [file for file in request.files.getlist('image') if file.filename]
+        if not files:
             flash('No image file selected')
             return redirect(request.url)
         
-        file = request.files['image']
-        if file.filename == '':
-            flash('No image file selected')
-            return redirect(request.url)
-        
-        if file:
-            filename = secure_filename(f"{name}_{student_id}.jpg")
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        filepaths = []
+        for i, file in enumerate(files):
+            # Extra photos are Name_ID.2.jpg, which still parses as Name_ID
+            suffix = f".{i + 1}" if i else ""
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(f"{name}_{student_id}{suffix}.jpg"))
             file.save(filepath)
-            
-            success, message = attendance_system.add_student(name, student_id, filepath)
-            
-            if success:
-                flash(f'Student {name} added successfully!', 'success')
-                return redirect(url_for('students'))
-            else:
-                flash(f'Error: {message}', 'error')
+            filepaths.append(filepath)
+        
+        success, message = attendance_system.add_student(name, student_id, filepaths)
+        
+        if success:
+            flash(f'Student {name} added successfully! {message}', 'success')
+            return redirect(url_for('students'))
+        else:
+            flash(f'Error: {message}', 'error')
     
     return render_template('add_student.html')
 
+@app.route('/bulk_enroll', methods=['POST'])
+def bulk_enroll():
+    """Start enrolling a zip upload or a directory under UPLOAD_FOLDER"""
+    wants_json = request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html
+    upload_root = os.path.realpath(app.config['UPLOAD_FOLDER'])
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        source = os.path.join(upload_root, secure_filename(archive.filename))
+        archive.save(source)
+    else:
+        # Only directories inside the upload folder, never arbitrary server
+        # paths nor the whole folder (every photo ever uploaded)
+        directory = request.form.get('directory', '').strip()
+        source = os.path.realpath(os.path.join(upload_root, directory))
+        if (not directory or source == upload_root or os.path.commonpath([upload_root, source]) != upload_root
+                or not os.path.isdir(source)):
+            message = f"directory must be a folder inside {app.config['UPLOAD_FOLDER']}"
+            if wants_json:
+                return jsonify({'status': 'error', 'message': message}), 400
+            flash(f'Error: {message}', 'error')
+            return redirect(url_for('add_student'))
+    
+    job_id = attendance_system.start_bulk_enroll(source, per_student_folders=bool(request.form.get('folders')))
+    if wants_json:
+        return jsonify({'job_id': job_id, 'status_url': url_for('bulk_enroll_status', job_id=job_id)}), 202
+    flash(f'Bulk enrollment started (job {job_id}); students appear as soon as it finishes', 'success')
+    return redirect(url_for('students'))
+
+@app.route('/bulk_enroll/<job_id>')
+def bulk_enroll_status(job_id):
+    """Progress and result of a bulk enrollment job"""
+    job = attendance_system.bulk_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown job {job_id}'}), 404
+    return jsonify(job)
+
+def attendance_filters(args):
+    """Storage filters from query args; date is shorthand for start=end=date"""
+    date = args.get('date')
+    return {
+        'start_date': args.get('start') or date,
+        'end_date': args.get('end') or date,
+        'student': args.get('student'),
+        'status': args.get('status'),
+    }
+
+def csv_lines(records):
+    """Yield a CSV export one line at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ATTENDANCE_COLUMNS)
+    # Header on its own, so an export with no matching rows still has it
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for record in records:
+        writer.writerow([record.get(column) for column in ATTENDANCE_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
 @app.route('/attendance')
 def attendance():
     date = request.args.get('date')
-    attendance_data = attendance_system.get_attendance_data(date)
-    return render_template('attendance.html', attendance=attendance_data, date=date)
+    cursor = request.args.get('cursor')
+    if cursor and not attendance_system.valid_cursor(cursor):
+        return "Invalid cursor", 400
+    attendance_data, next_cursor = attendance_system.get_attendance_page(100, cursor, **attendance_filters(request.args))
+    return render_template('attendance.html', attendance=attendance_data, date=date, next_cursor=next_cursor)
 
-@app.route('/live_attendance')
-def live_attendance():
-    return render_template('live_attendance.html')
+@app.route('/api/attendance')
+def api_attendance():
+    """Filtered attendance as paginated JSON, or a streamed NDJSON/CSV export"""
+    filters = attendance_filters(request.args)
+    cursor = request.args.get('cursor')
+    if cursor and not attendance_system.valid_cursor(cursor):
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    output = request.args.get('format', 'json')
+    if output == 'json':
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        records, next_cursor = attendance_system.get_attendance_page(limit, cursor, **filters)
+        return jsonify({'records': records, 'count': len(records), 'next_cursor': next_cursor})
+    
+    records = attendance_system.iter_attendance(cursor, **filters)
+    if output == 'ndjson':
+        return Response((json.dumps(record) + '\n' for record in records), mimetype='application/x-ndjson')
+    if output == 'csv':
+        return Response(csv_lines(records), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=attendance.csv'})
+    return jsonify({'error': f'Unknown format: {output}'}), 400
 
-@app.route('/start_camera')
-def start_camera():
+@app.route('/summary')
+def summary():
+    return render_template('summary.html', summary=attendance_system.get_attendance_summary())
+
+@app.route('/api/attendance/summary')
+def api_attendance_summary():
+    return jsonify(attendance_system.get_attendance_summary())
+
+def get_camera(camera_id):
+    """Camera for a route, or a 404 JSON error for unknown ids"""
+    camera = attendance_system.cameras.get(camera_id)
+    if camera is None:
+        return None, (jsonify({'status': 'error', 'message': f'Unknown camera {camera_id}'}), 404)
+    return camera, None
+
+@app.route('/live_attendance', defaults={'camera_id': None})
+@app.route('/live_attendance/<camera_id>')
+def live_attendance(camera_id):
+    camera_id = camera_id or attendance_system.cameras.default_id
+    return render_template('live_attendance.html', camera_id=camera_id,
+                           cameras=list(attendance_system.cameras.cameras))
+
+@app.route('/start_camera', defaults={'camera_id': None})
+@app.route('/start_camera/<camera_id>')
+def start_camera(camera_id):
     """Start camera for live streaming"""
-    if attendance_system.start_camera():
-        return jsonify({'status': 'success', 'message': 'Camera started'})
+    camera, error = get_camera(camera_id)
+    if error:
+        return error
+    try:
+        if camera.start():
+            return jsonify({'status': 'success', 'message': 'Camera started'})
+    except IOError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
     return jsonify({'status': 'error', 'message': 'Camera already running'})
 
-@app.route('/stop_camera')
-def stop_camera():
+@app.route('/stop_camera', defaults={'camera_id': None})
+@app.route('/stop_camera/<camera_id>')
+def stop_camera(camera_id):
     """Stop camera streaming"""
-    if attendance_system.stop_camera():
+    camera, error = get_camera(camera_id)
+    if error:
+        return error
+    if camera.stop():
         return jsonify({'status': 'success', 'message': 'Camera stopped'})
     return jsonify({'status': 'error', 'message': 'Camera not running'})
 
-@app.route('/start_attendance')
-def start_attendance():
+@app.route('/start_attendance', defaults={'camera_id': None})
+@app.route('/start_attendance/<camera_id>')
+def start_attendance(camera_id):
     """Start attendance session"""
-    if attendance_system.is_streaming:
-        attendance_system.attendance_session_active = True
+    camera, error = get_camera(camera_id)
+    if error:
+        return error
+    if camera.start_attendance():
         return jsonify({'status': 'success', 'message': 'Attendance session started'})
     return jsonify({'status': 'error', 'message': 'Camera not running'})
 
-@app.route('/stop_attendance')
-def stop_attendance():
+@app.route('/stop_attendance', defaults={'camera_id': None})
+@app.route('/stop_attendance/<camera_id>')
+def stop_attendance(camera_id):
     """Stop attendance session"""
-    attendance_system.attendance_session_active = False
+    camera, error = get_camera(camera_id)
+    if error:
+        return error
+    camera.stop_attendance()
     return jsonify({'status': 'success', 'message': 'Attendance session stopped'})
 
-@app.route('/video_feed')
-def video_feed():
+@app.route('/video_feed', defaults={'camera_id': None})
+@app.route('/video_feed/<camera_id>')
+def video_feed(camera_id):
     """Video streaming route"""
-    if attendance_system.is_streaming:
-        return Response(attendance_system.generate_frames(),
+    camera = attendance_system.cameras.get(camera_id)
+    if camera and camera.is_streaming:
+        return Response(attendance_system.generate_frames(camera_id),
                        mimetype='multipart/x-mixed-replace; boundary=frame')
     return "Camera not started", 404
 
-@app.route('/attendance_status')
-def attendance_status():
+@app.route('/attendance_status', defaults={'camera_id': None})
+@app.route('/attendance_status/<camera_id>')
+def attendance_status(camera_id):
     """Get current attendance session status"""
+    camera, error = get_camera(camera_id)
+    if error:
+        return error
+    status = camera.status()
+    status.update({
+        'camera_id': camera.camera_id,
+        'students_registered': len(attendance_system.students_data),
+        'cameras': attendance_system.cameras.status()
+    })
+    return jsonify(status)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: stage latency histograms and face/frame counters"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def upload_payloads(field):
+    """Image bytes from multipart files or base64 strings (data URLs allowed) in a JSON body"""
+    if request.files:
+        return [upload.read() for upload in request.files.getlist(field)]
+    payload = request.get_json(silent=True) or {}
+    return [base64.b64decode(item.split(',', 1)[-1]) for item in payload.get(field, [])]
+
+@app.route('/recognize', methods=['POST'])
+def recognize():
+    """Stateless recognition for uploaded frames and face crops (kiosks, serverless)"""
+    try:
+        frames = upload_payloads('frames')
+        faces = upload_payloads('faces')
+    except (ValueError, TypeError, AttributeError):
+        return jsonify({'status': 'error', 'message': 'Images must be files or base64 strings'}), 400
+    if not frames and not faces:
+        return jsonify({'status': 'error', 'message': 'No frames or faces uploaded'}), 400
+    if len(frames) + len(faces) > app.config['MAX_RECOGNIZE_IMAGES']:
+        return jsonify({'status': 'error',
+                        'message': f"At most {app.config['MAX_RECOGNIZE_IMAGES']} images per request"}), 400
+    
+    options = request.form if request.files else (request.get_json(silent=True) or {})
+    mark = str(options.get('mark', '')).lower() in ('1', 'true')
+    started = time.perf_counter()
+    results = attendance_system.recognize_images(frames, faces, mark)
+    results.update({'status': 'success', 'elapsed_ms': round(1000 * (time.perf_counter() - started), 1)})
+    return jsonify(results)
+
+@app.route('/embeddings', methods=['POST'])
+def embeddings():
+    """Match encodings computed on the device and mark attendance.
+    
+    The body is raw little-endian float32 (default) or float16 values, 128
+    per face, with ?dtype=float16 for the latter; or JSON {"encodings":
+    [[...128 floats], ...]}. Pass mark=0 to match without marking.
+    """
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        try:
+            encodings = np.asarray(payload.get('encodings', []), dtype=np.float32)
+        except (TypeError, ValueError):
+            return jsonify({'status': 'error', 'message': 'encodings must be lists of numbers'}), 400
+        mark = payload.get('mark', True)
+    else:
+        dtype = {'float32': '<f4', 'float16': '<f2'}.get(request.args.get('dtype', 'float32'))
+        if dtype is None:
+            return jsonify({'status': 'error', 'message': 'dtype must be float32 or float16'}), 400
+        body = request.get_data()
+        if len(body) % (ENCODING_SIZE * np.dtype(dtype).itemsize):
+            return jsonify({'status': 'error',
+                            'message': f'Body must hold whole {ENCODING_SIZE}-value encodings'}), 400
+        encodings = np.frombuffer(body, dtype=dtype).astype(np.float32)
+        mark = request.args.get('mark', '1')
+    
+    encodings = encodings.reshape(-1, ENCODING_SIZE) if encodings.size % ENCODING_SIZE == 0 else None
+    if encodings is None or not len(encodings):
+        return jsonify({'status': 'error', 'message': f'Send one or more {ENCODING_SIZE}-value encodings'}), 400
+    if len(encodings) > app.config['MAX_EMBEDDINGS']:
+        return jsonify({'status': 'error',
+                        'message': f"At most {app.config['MAX_EMBEDDINGS']} encodings per request"}), 400
+    if not np.isfinite(encodings).all():
+        return jsonify({'status': 'error', 'message': 'Encodings must be finite'}), 400
+    
+    mark = str(mark).lower() not in ('0', 'false')
+    return jsonify({'status': 'success', 'results': attendance_system.match_encodings(encodings, mark)})
+
+@app.route('/health')
+def health():
+    """Startup timings and which parts of the app are loaded"""
     return jsonify({
-        'camera_running': attendance_system.is_streaming,
-        'attendance_active': attendance_system.attendance_session_active,
-        'students_registered': len(attendance_system.known_face_encodings)
+        'startup': STARTUP,
+        'system_loaded': _attendance_system is not None,
+        'gallery_loaded': _attendance_system is not None and _attendance_system._gallery is not None,
+        'gallery_version': _attendance_system.gallery_version if _attendance_system is not None else 0,
+        'recognition_loaded': 'face_recognition' in sys.modules,
     })
 
+@app.route('/warmup', methods=['POST'])
+def warmup():
+    """Warm-up hook, e.g. for a platform's post-deploy or health check"""
+    attendance_system.warm_up()
+    return jsonify({'status': 'success', 'startup': STARTUP})
+
+STARTUP['import_seconds'] = round(time.perf_counter() - _import_started, 3)
+
+# Set ATTENDANCE_WARMUP=1 to load everything in the background at import
+if os.environ.get('ATTENDANCE_WARMUP') == '1':
+    threading.Thread(target=lambda: attendance_system.warm_up(), daemon=True).start()
+
 if __name__ == '__main__':
     app.run(debug=True, threaded=True)
\ No newline at end of file